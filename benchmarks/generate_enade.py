@@ -0,0 +1,110 @@
+import argparse
+import sys
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+SRC_FOLDER = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC_FOLDER))
+
+from main import COLUMN_MAPS, RENAME_DICT
+
+# Approximate shares of the ENADE microdata; codes match COLUMN_MAPS in main.py.
+CATEGORY_SHARES = {1: 0.14, 2: 0.07, 3: 0.02, 4: 0.42, 5: 0.34, 7: 0.01}
+ORGANIZATION_SHARES = {10019: 0.01, 10020: 0.27, 10022: 0.28, 10026: 0.04, 10028: 0.40}
+MODALITY_SHARES = {0: 0.38, 1: 0.62}
+CATEGORY_GRADE_SHIFT = {1: 6.0, 2: 4.0, 3: -2.0, 4: -3.0, 5: 0.0, 7: 1.0}
+ENEM_COLUMNS = ['ENEM_NT_CN', 'ENEM_NT_CH', 'ENEM_NT_LC', 'ENEM_NT_MT']
+
+ABSENT_RATE = 0.08       # TP_PRES 222: registered but absent, no grade
+ZERO_GRADE_RATE = 0.01   # present with a zero grade, dropped by the NT_GER > 0 filter
+ENEM_MISSING_RATE = 0.35  # students without a linked ENEM record
+ENEM_PARTIAL_RATE = 0.03  # per grade, linked records with a single missing area
+
+
+def parse_rows(value: str) -> int:
+    multipliers = {'K': 1_000, 'M': 1_000_000}
+    value = value.strip().upper()
+    if value[-1] in multipliers:
+        return int(float(value[:-1]) * multipliers[value[-1]])
+    return int(value)
+
+
+def generate_chunk(year: int, rows: int, seed: int, chunk_index: int) -> pd.DataFrame:
+    # Each chunk has its own seed, so chunks are independent; per-area parameters are fixed per year.
+    rng = np.random.default_rng([seed, year, chunk_index])
+    year_rng = np.random.default_rng([seed, year])
+
+    def choice(shares: dict) -> np.ndarray:
+        return rng.choice(list(shares), rows, p=np.array(list(shares.values())) / sum(shares.values()))
+
+    areas = list(COLUMN_MAPS['CODIGO_AREA_AVALIACAO'])
+    area_weights = year_rng.dirichlet(np.full(len(areas), 2.0))
+    area_shift = year_rng.normal(0, 5, len(areas))
+
+    category = choice(CATEGORY_SHARES)
+    area_index = rng.choice(len(areas), rows, p=area_weights)
+    start_year = year - rng.choice([3, 4, 5, 6, 7, 8, 9, 10], rows, p=[0.05, 0.35, 0.3, 0.12, 0.08, 0.05, 0.03, 0.02])
+
+    grade = rng.normal(45, 14, rows) + pd.Series(category).map(CATEGORY_GRADE_SHIFT).to_numpy() + area_shift[area_index]
+    grade = np.round(np.clip(grade, 0.1, 100), 1)
+    presence = np.where(rng.random(rows) < ABSENT_RATE, 222, 555)
+    grade[presence == 222] = np.nan
+    grade[(presence == 555) & (rng.random(rows) < ZERO_GRADE_RATE)] = 0.0
+
+    df = pd.DataFrame({
+        'NU_ANO': year,
+        'CO_IES': rng.integers(1, 25_000, rows),
+        'CO_CATEGAD': category,
+        'CO_ORGACAD': choice(ORGANIZATION_SHARES),
+        'CO_GRUPO': np.asarray(areas)[area_index],
+        'CO_CURSO': rng.integers(1, 5_000_000, rows),
+        'CO_MODALIDADE': choice(MODALITY_SHARES),
+        'CO_MUNIC_CURSO': rng.integers(1_100_015, 5_300_109, rows),
+        'TP_INSCRICAO': rng.choice([0, 1], rows, p=[0.9, 0.1]),
+        'IN_REGULAR': rng.choice([0, 1], rows, p=[0.02, 0.98]),
+        'TP_INSCRICAO_ADM': rng.choice([0, 1], rows, p=[0.85, 0.15]),
+        'ANO_IN_GRAD': start_year,
+        'TP_PRES': presence,
+        'NT_GER': grade,
+        'ANO_ENEM': start_year - rng.choice([0, 1, 2], rows, p=[0.6, 0.3, 0.1]),
+    })
+
+    has_enem = rng.random(rows) >= ENEM_MISSING_RATE
+    df['ANO_ENEM'] = df['ANO_ENEM'].where(has_enem).astype('Int64')
+    ability = rng.normal(0, 1, rows)
+    for col, mean in zip(ENEM_COLUMNS, (500, 520, 530, 540)):
+        grades = np.round(np.clip(mean + 60 * ability + rng.normal(0, 45, rows), 0, 1000), 1)
+        grades[~has_enem | (rng.random(rows) < ENEM_PARTIAL_RATE)] = np.nan
+        df[col] = grades
+
+    # The raw files carry many more columns than main.py reads.
+    df['TP_SEXO'] = rng.choice(['F', 'M'], rows, p=[0.6, 0.4])
+    df['NU_IDADE'] = (year - start_year) + rng.integers(17, 30, rows)
+    return df[list(RENAME_DICT) + ['TP_SEXO', 'NU_IDADE']]
+
+
+def generate(output_path: Path, rows: int, year: int = 2021, seed: int = 0, chunk_size: int = 1_000_000):
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = output_path.with_name(output_path.name + '.partial')
+    for chunk_index, start in enumerate(range(0, rows, chunk_size)):
+        chunk = generate_chunk(year, min(chunk_size, rows - start), seed, chunk_index)
+        chunk.to_csv(partial_path, sep=';', index=False, mode='w' if chunk_index == 0 else 'a', header=chunk_index == 0)
+    partial_path.replace(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write deterministic ENADE-shaped raw data (semicolon separated, like the microdata).')
+    parser.add_argument('--rows', default='1M', help='Row count, e.g. 200K, 1M, 10M or 50M.')
+    parser.add_argument('--year', type=int, default=2021)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=Path, help='Defaults to data/raw/<year>.txt.')
+    args = parser.parse_args()
+
+    output_path = args.output or Path('data/raw') / f'{args.year}.txt'
+    generate(output_path, parse_rows(args.rows), args.year, args.seed)
+    print(f"Wrote {parse_rows(args.rows):,} rows to {output_path}")
+
+
+if __name__ == '__main__':
+    main()
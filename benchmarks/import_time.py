@@ -0,0 +1,56 @@
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_FOLDER = Path(__file__).resolve().parent.parent / 'src'
+
+HEAVY_MODULES = ['matplotlib', 'seaborn', 'sklearn']
+
+# What each entry point imports; 'eager' adds the plotting and scikit-learn stack up front,
+# as every entry point did before imports were deferred.
+ENTRY_POINTS = {
+    'DataProcessor': 'import Modules.DataProcessor',
+    'GraphGenerator': 'import Modules.GraphGenerator',
+    'main (process/aggregate)': 'import main',
+}
+EAGER_IMPORTS = 'import matplotlib.figure, seaborn, sklearn.preprocessing; '
+
+
+def time_import(statement: str) -> tuple[float, list[str]]:
+    code = (
+        'import sys, time\n'
+        'start = time.perf_counter()\n'
+        f'{statement}\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(elapsed, *[name for name in {HEAVY_MODULES!r} if name in sys.modules])\n'
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=SRC_FOLDER, check=True, capture_output=True, text=True).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare cold import time of the entry points with and without the eager plotting stack.')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        import sklearn  # noqa: F401
+        eager_prefix = EAGER_IMPORTS
+    except ImportError:
+        # scikit-learn is no longer a dependency; compare against the plotting stack alone.
+        eager_prefix = 'import matplotlib.figure, seaborn; '
+
+    print(f"{'entry point':<26} {'lazy ms':>9} {'eager ms':>9} {'saved':>7}  heavy modules loaded (lazy)")
+    for name, statement in ENTRY_POINTS.items():
+        lazy_runs = [time_import(statement) for _ in range(args.repeat)]
+        eager_runs = [time_import(eager_prefix + statement)[0] for _ in range(args.repeat)]
+        lazy = statistics.median(run[0] for run in lazy_runs) * 1000
+        eager = statistics.median(eager_runs) * 1000
+        loaded = ', '.join(lazy_runs[0][1]) or 'none'
+        print(f"{name:<26} {lazy:>9.0f} {eager:>9.0f} {1 - lazy / eager:>7.0%}  {loaded}")
+
+
+if __name__ == '__main__':
+    main()
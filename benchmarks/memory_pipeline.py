@@ -0,0 +1,68 @@
+import argparse
+import json
+import resource
+import subprocess
+import sys
+from pathlib import Path
+
+SRC_FOLDER = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC_FOLDER))
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_pipeline(raw_data_folder: Path, raw_data_file: str, chunk_size: int, copy: bool) -> dict:
+    from Modules.DataLoader import DataLoader
+    from main import process_raw_data
+
+    baseline_mb = peak_rss_mb()
+    processor = process_raw_data(DataLoader(raw_data_folder), raw_data_file, chunk_size, copy=copy)
+    processed_df = processor.build()
+    for group_by_col in ('CODIGO_CATEGORIA_ADMINISTRATIVA', 'CODIGO_AREA_AVALIACAO'):
+        processor.get_robust_group_aggregation(group_by_col, agg_col='NOTA_GERAL_ENADE')
+
+    return {
+        'copy': copy,
+        'rows': len(processed_df),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'pipeline_rss_mb': round(peak_rss_mb() - baseline_mb, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare peak RSS of the main.py pipeline with and without copies.')
+    parser.add_argument('--raw-data-folder', type=Path, default=Path('data/raw'))
+    parser.add_argument('--raw-data-file', default='2021.txt')
+    parser.add_argument('--chunk-size', type=int, default=500_000)
+    parser.add_argument('--mode', choices=['copy', 'no-copy'], help='Run a single mode in this process and print JSON.')
+    args = parser.parse_args()
+
+    if args.mode:
+        result = run_pipeline(args.raw_data_folder, args.raw_data_file, args.chunk_size, copy=args.mode == 'copy')
+        print(json.dumps(result))
+        return
+
+    # Each mode runs in a fresh interpreter so the peaks do not contaminate each other.
+    results = []
+    for mode in ('copy', 'no-copy'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--raw-data-folder', str(args.raw_data_folder),
+             '--raw-data-file', args.raw_data_file, '--chunk-size', str(args.chunk_size)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'mode':<10}{'rows':>12}{'peak RSS (MB)':>16}{'pipeline (MB)':>16}")
+    for result in results:
+        mode = 'copy' if result['copy'] else 'no-copy'
+        print(f"{mode:<10}{result['rows']:>12}{result['peak_rss_mb']:>16}{result['pipeline_rss_mb']:>16}")
+
+    saved = results[0]['pipeline_rss_mb'] - results[1]['pipeline_rss_mb']
+    print(f"no-copy saves {saved:.1f} MB of pipeline peak RSS")
+
+
+if __name__ == '__main__':
+    main()
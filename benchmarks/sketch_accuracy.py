@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+SRC_FOLDER = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC_FOLDER))
+
+from Modules.DataLoader import DataLoader
+from Modules.DataProcessor import ChunkedDataProcessor, DataProcessor
+from main import RENAME_DICT
+
+DATA_COLS = ['NOTA_ENEM_MATEMATICA', 'NOTA_GERAL_ENADE']
+GROUP_BY_COL = 'CODIGO_CATEGORIA_ADMINISTRATIVA'
+AGG_GROUP_BY_COL = 'CODIGO_AREA_AVALIACAO'
+
+
+def filtered_chunks(loader: DataLoader, raw_data_file: str, chunk_size: int) -> ChunkedDataProcessor:
+    source = partial(loader.iter_csv, raw_data_file, delimiter=';', chunk_size=chunk_size, usecols=list(RENAME_DICT))
+    return ChunkedDataProcessor(source).filter_rows('NT_GER', '>', 0).rename_columns(RENAME_DICT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare sketch-based group-wise IQR filtering against the exact in-memory version.')
+    parser.add_argument('--raw-data-folder', type=Path, default=Path('data/raw'))
+    parser.add_argument('--raw-data-file', default='2021.txt')
+    parser.add_argument('--chunk-size', type=int, default=500_000)
+    parser.add_argument('--relative-accuracy', type=float, default=0.01)
+    args = parser.parse_args()
+
+    loader = DataLoader(args.raw_data_folder)
+
+    start = time.perf_counter()
+    exact = DataProcessor(filtered_chunks(loader, args.raw_data_file, args.chunk_size).build())
+    exact_kept = len(exact.remove_outliers_by_group(DATA_COLS, GROUP_BY_COL).build())
+    exact_means = exact.get_robust_group_aggregation(AGG_GROUP_BY_COL, 'NOTA_GERAL_ENADE').set_index(AGG_GROUP_BY_COL)
+    exact_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    streamed = filtered_chunks(loader, args.raw_data_file, args.chunk_size) \
+        .remove_outliers_by_group(DATA_COLS, GROUP_BY_COL, args.relative_accuracy)
+    sketch_kept = sum(len(chunk) for chunk in streamed.iter_chunks())
+    sketch_means = streamed.get_robust_group_aggregation(AGG_GROUP_BY_COL, 'NOTA_GERAL_ENADE',
+                                                         relative_accuracy=args.relative_accuracy).set_index(AGG_GROUP_BY_COL)
+    sketch_seconds = time.perf_counter() - start
+
+    mean_error = (sketch_means['NOTA_GERAL_ENADE'] - exact_means['NOTA_GERAL_ENADE']).abs()
+    print(json.dumps({
+        'relative_accuracy': args.relative_accuracy,
+        'exact_rows_kept': exact_kept,
+        'sketch_rows_kept': sketch_kept,
+        'rows_kept_difference': abs(sketch_kept - exact_kept) / max(exact_kept, 1),
+        'max_abs_mean_error': float(mean_error.max()) if len(mean_error) else 0.0,
+        'groups_exact': len(exact_means),
+        'groups_sketch': len(sketch_means),
+        'exact_seconds': round(exact_seconds, 2),
+        'sketch_seconds': round(sketch_seconds, 2),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import argparse
+import json
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+BENCHMARKS_FOLDER = Path(__file__).resolve().parent
+SRC_FOLDER = BENCHMARKS_FOLDER.parent / 'src'
+sys.path.insert(0, str(SRC_FOLDER))
+
+import matplotlib
+matplotlib.use('Agg')
+import pandas as pd
+
+from generate_enade import generate, parse_rows
+from main import COLUMN_MAPS, RENAME_DICT
+from Modules.DataLoader import DataLoader
+from Modules.DataProcessor import ChunkedDataProcessor, DataProcessor
+from Modules.Plotter import PlotterFactory
+from Modules.Profiler import Profiler
+
+ENEM_GRADE_COLS = ['NOTA_ENEM_CIENCIAS_NATUREZA', 'NOTA_ENEM_CIENCIAS_HUMANAS', 'NOTA_ENEM_LINGUAGENS_CODIGOS', 'NOTA_ENEM_MATEMATICA']
+GROUP_BY_COL = 'CODIGO_CATEGORIA_ADMINISTRATIVA'
+AGG_COL = 'NOTA_GERAL_ENADE'
+
+# Each benchmark runs on a fresh DataProcessor over the filtered and renamed frame.
+PROCESSOR_BENCHMARKS = {
+    'select_columns': lambda p: p.select_columns(list(RENAME_DICT.values())[:10]),
+    'rename_columns': lambda p: p.rename_columns({AGG_COL: 'GRADE'}),
+    'filter_rows': lambda p: p.filter_rows(AGG_COL, '>', 50),
+    'filter_conditions': lambda p: p.filter_conditions([(AGG_COL, '>', 20), ('NOTA_ENEM_MATEMATICA', '<', 700)]),
+    'convert_type': lambda p: p.convert_type('ANO_INICIO_GRADUACAO', 'int'),
+    'impute_by_group_mean': lambda p: p.impute_by_group_mean(ENEM_GRADE_COLS, GROUP_BY_COL),
+    'normalize_column': lambda p: p.normalize_column(AGG_COL),
+    'map_columns': lambda p: p.map_columns(COLUMN_MAPS),
+    'add_duration_column': lambda p: p.add_duration_column('DURATION_GRADUATION', 'ANO_INICIO_GRADUACAO', 'ANO_ENADE'),
+    'remove_outliers_by_group': lambda p: p.remove_outliers_by_group(['NOTA_ENEM_MATEMATICA', AGG_COL], GROUP_BY_COL),
+    'remove_outliers_by_group_sketch': lambda p: p.remove_outliers_by_group(['NOTA_ENEM_MATEMATICA', AGG_COL], GROUP_BY_COL, relative_accuracy=0.01),
+    'compact_dtypes': lambda p: p.compact_dtypes(downcast_floats=False),
+    'get_robust_group_aggregations': lambda p: p.get_robust_group_aggregations(
+        [GROUP_BY_COL, 'CODIGO_MODALIDADE_ENSINO', 'CODIGO_AREA_AVALIACAO', 'ANO_INICIO_GRADUACAO'], AGG_COL),
+}
+
+PLOT_CONFIGS = {
+    'bar': {'x_col': GROUP_BY_COL, 'y_col': AGG_COL, 'aggregated': True},
+    'line': {'x_col': 'ANO_INICIO_GRADUACAO', 'y_col': AGG_COL, 'aggregated': True},
+    'histogram': {'x_col': AGG_COL},
+    'box': {'x_col': GROUP_BY_COL, 'y_col': 'NOTA_ENEM_MATEMATICA'},
+    'violin': {'x_col': 'CODIGO_ORGANIZACAO_ACADEMICA', 'y_col': AGG_COL},
+    'scatter': {'x_col': 'NOTA_ENEM_MATEMATICA', 'y_col': AGG_COL, 'hue': GROUP_BY_COL},
+    'heatmap': {'columns': ENEM_GRADE_COLS},
+}
+
+
+def load_filtered(raw_data_folder: Path, raw_data_file: str) -> pd.DataFrame:
+    raw_chunks = lambda: DataLoader(raw_data_folder).iter_csv(raw_data_file, delimiter=';', chunk_size=500_000, usecols=list(RENAME_DICT))
+    return ChunkedDataProcessor(raw_chunks).filter_rows('NT_GER', '>', 0).rename_columns(RENAME_DICT).build()
+
+
+def measure(name: str, func, *args, **kwargs) -> dict:
+    Profiler.call(name, func, args, kwargs)
+    record = Profiler.records[-1]
+    return {key: record[key] for key in ('wall_seconds', 'cpu_seconds', 'peak_memory_bytes')}
+
+
+def bench_processor(filtered_df: pd.DataFrame) -> dict:
+    results = {}
+    for name, step in PROCESSOR_BENCHMARKS.items():
+        processor = DataProcessor(filtered_df)
+        results[f'processor.{name}'] = measure(name, step, processor)
+    return results
+
+
+def bench_plotters(filtered_df: pd.DataFrame, output_folder: Path) -> dict:
+    processed_df = DataProcessor(filtered_df) \
+        .impute_by_group_mean(ENEM_GRADE_COLS, GROUP_BY_COL) \
+        .remove_outliers_by_group(['NOTA_ENEM_MATEMATICA', AGG_COL], GROUP_BY_COL) \
+        .map_columns(COLUMN_MAPS) \
+        .build()
+    aggregations = DataProcessor(processed_df).get_robust_group_aggregations([GROUP_BY_COL, 'ANO_INICIO_GRADUACAO'], AGG_COL)
+
+    results = {}
+    for plot_type, config in PLOT_CONFIGS.items():
+        config = dict(config, plot_type=plot_type, title=plot_type, output_file_name=f'{plot_type}.png')
+        df = aggregations[config['x_col']] if config.pop('aggregated', False) else processed_df
+        plotter = PlotterFactory.get_plotter(plot_type)
+        results[f'plot.{plot_type}'] = measure(plot_type, plotter.plot, df, output_folder / config['output_file_name'], **config)
+    return results
+
+
+def bench_pipeline(raw_data_folder: Path, work_folder: Path) -> dict:
+    # A cold run of main.py in a scratch folder; memory is the peak RSS of the child process.
+    run_folder = work_folder / 'pipeline'
+    if run_folder.exists():
+        shutil.rmtree(run_folder)
+    (run_folder / 'data').mkdir(parents=True)
+    shutil.copytree(raw_data_folder, run_folder / 'data' / 'raw')
+
+    wall_start = time.perf_counter()
+    subprocess.run([sys.executable, str(SRC_FOLDER / 'main.py')], cwd=run_folder, check=True, stdout=subprocess.DEVNULL)
+    wall = time.perf_counter() - wall_start
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {'pipeline.main': {
+        'wall_seconds': wall,
+        'cpu_seconds': usage.ru_utime + usage.ru_stime,
+        # ru_maxrss is reported in kilobytes on Linux.
+        'peak_memory_bytes': usage.ru_maxrss * 1024,
+    }}
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_seconds: float) -> pd.DataFrame:
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ('wall_seconds', 'peak_memory_bytes'):
+            ratio = current[metric] / previous[metric] if previous[metric] else float('nan')
+            noise = metric == 'wall_seconds' and current[metric] - previous[metric] < min_seconds
+            rows.append({
+                'benchmark': name,
+                'metric': metric,
+                'baseline': previous[metric],
+                'current': current[metric],
+                'ratio': ratio,
+                'regression': bool(ratio > 1 + threshold and not noise),
+            })
+    return pd.DataFrame(rows, columns=['benchmark', 'metric', 'baseline', 'current', 'ratio', 'regression'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time and memory-profile DataProcessor methods, plotters and the main.py pipeline.')
+    parser.add_argument('--rows', default='200K', help='Synthetic raw rows, e.g. 200K, 1M, 10M or 50M.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-folder', type=Path, default=Path(tempfile.gettempdir()) / 'enade-benchmarks')
+    parser.add_argument('--results', type=Path, default=BENCHMARKS_FOLDER / 'results' / 'latest.json')
+    parser.add_argument('--baseline', type=Path, default=BENCHMARKS_FOLDER / 'results' / 'baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help='Store these results as the new baseline.')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Relative slowdown or memory growth reported as a regression.')
+    parser.add_argument('--min-seconds', type=float, default=0.05, help='Ignore wall time differences below this.')
+    parser.add_argument('--skip', nargs='*', default=[], choices=['processor', 'plot', 'pipeline'])
+    args = parser.parse_args()
+
+    rows = parse_rows(args.rows)
+    raw_data_folder = args.work_folder / f'raw-{rows}-{args.seed}'
+    if not (raw_data_folder / '2021.txt').exists():
+        print(f"Generating {rows:,} synthetic rows into {raw_data_folder}")
+        generate(raw_data_folder / '2021.txt', rows, seed=args.seed)
+
+    Profiler.enable()
+    results = {}
+    if 'processor' not in args.skip or 'plot' not in args.skip:
+        filtered_df = load_filtered(raw_data_folder, '2021.txt')
+        if 'processor' not in args.skip:
+            results.update(bench_processor(filtered_df))
+        if 'plot' not in args.skip:
+            plot_folder = args.work_folder / 'plots'
+            plot_folder.mkdir(parents=True, exist_ok=True)
+            results.update(bench_plotters(filtered_df, plot_folder))
+    Profiler.disable()
+    if 'pipeline' not in args.skip:
+        results.update(bench_pipeline(raw_data_folder, args.work_folder))
+
+    report = {
+        'meta': {
+            'rows': rows,
+            'seed': args.seed,
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        },
+        'results': results,
+    }
+    args.results.parent.mkdir(parents=True, exist_ok=True)
+    args.results.write_text(json.dumps(report, indent=2))
+
+    summary = pd.DataFrame.from_dict(results, orient='index')
+    summary['peak_memory_mb'] = (summary.pop('peak_memory_bytes') / 1024 ** 2).round(1)
+    print(summary.round(3).to_string())
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2))
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not args.baseline.exists():
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    if baseline['meta']['rows'] != rows:
+        print(f"--> WARNING: baseline was recorded with {baseline['meta']['rows']:,} rows, this run used {rows:,}.")
+
+    comparison = compare(results, baseline['results'], args.threshold, args.min_seconds)
+    regressions = comparison[comparison['regression']]
+    print(comparison.round(3).to_string(index=False))
+    if not regressions.empty:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}:")
+        print(regressions[['benchmark', 'metric', 'ratio']].round(2).to_string(index=False))
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import json
+import shutil
+import pandas as pd
+from pathlib import Path
+from typing import Optional
+from Modules.QuantileSketch import GroupedQuantileSketch
+
+
+class AggregateStore:
+    """Per-year GroupedQuantileSketch state on disk, merged across years on demand.
+
+    By default the state is exact: the tables match
+    ``DataProcessor.get_robust_group_aggregation``, but each year keeps one
+    bucket per distinct value, which for a continuous column is about the
+    column's size. With a ``relative_accuracy`` (e.g. 0.001) each year stores
+    at most a few thousand buckets per group and group key however many rows
+    it has; quartile fences are then within that relative error and the
+    trimmed means use exact sums of the buckets inside them.
+    """
+
+    MANIFEST_FILE = 'manifest.json'
+
+    def __init__(self, state_folder: Path, relative_accuracy: Optional[float] = None):
+        self.state_folder = Path(state_folder)
+        self.state_folder.mkdir(parents=True, exist_ok=True)
+        self.relative_accuracy = relative_accuracy
+
+    @staticmethod
+    def _fingerprint(source_path: Path) -> dict:
+        stat = Path(source_path).stat()
+        return {'source': Path(source_path).name, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _state_path(self, year: str, group_by_col: str, agg_col: str) -> Path:
+        return self.state_folder / str(year) / f"{group_by_col}__{agg_col}.parquet"
+
+    def state_files(self, year: str, group_by_cols: list[str], agg_col: str) -> list[Path]:
+        return [self.state_folder / str(year) / self.MANIFEST_FILE] + \
+            [self._state_path(year, group_by_col, agg_col) for group_by_col in group_by_cols]
+
+    def years(self) -> list[str]:
+        return sorted(entry.name for entry in self.state_folder.iterdir() if (entry / self.MANIFEST_FILE).exists())
+
+    def update(self, year: str, df: pd.DataFrame, group_by_cols: list[str], agg_col: str, source_path: Path):
+        year_folder = self.state_folder / str(year)
+        if year_folder.exists():
+            shutil.rmtree(year_folder)
+        year_folder.mkdir(parents=True)
+
+        for group_by_col in group_by_cols:
+            sketch = GroupedQuantileSketch(self.relative_accuracy).update(df[group_by_col], df[agg_col])
+            sketch.buckets.to_parquet(self._state_path(year, group_by_col, agg_col), index=False)
+
+        # The manifest is written last, so an interrupted update leaves the year marked as missing.
+        manifest = {'fingerprint': self._fingerprint(source_path), 'relative_accuracy': self.relative_accuracy}
+        (year_folder / self.MANIFEST_FILE).write_text(json.dumps(manifest))
+
+    def remove(self, year: str):
+        shutil.rmtree(self.state_folder / str(year), ignore_errors=True)
+
+    def load_sketch(self, group_by_col: str, agg_col: str, years: Optional[list[str]] = None) -> GroupedQuantileSketch:
+        sketch = GroupedQuantileSketch(self.relative_accuracy)
+        for year in (years if years is not None else self.years()):
+            state_path = self._state_path(year, group_by_col, agg_col)
+            if not state_path.exists():
+                raise FileNotFoundError(f"No aggregate state for year {year}: {state_path}")
+            sketch.merge_buckets(pd.read_parquet(state_path))
+        return sketch
+
+    def get_robust_group_aggregation(self, group_by_col: str, agg_col: str, min_sample_size: int = 30,
+                                     years: Optional[list[str]] = None) -> pd.DataFrame:
+        robust_means = self.load_sketch(group_by_col, agg_col, years).robust_means(min_sample_size)
+        if robust_means.empty:
+            print(f"--> WARNING: No groups in '{group_by_col}' met the minimum sample size of {min_sample_size}. The resulting aggregation will be empty.")
+            return pd.DataFrame(columns=[group_by_col, agg_col])
+
+        return robust_means.rename_axis(group_by_col).rename(agg_col).reset_index()
+
+    def get_group_means(self, group_by_col: str, agg_col: str, years: Optional[list[str]] = None) -> pd.DataFrame:
+        sketch = self.load_sketch(group_by_col, agg_col, years)
+        means = (sketch.sums() / sketch.counts()).sort_index()
+        return means.rename_axis(group_by_col).rename(agg_col).reset_index()
@@ -0,0 +1,200 @@
+import asyncio
+import io
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import parse_qsl, urlsplit
+import pandas as pd
+from Modules.DataProcessor import DataProcessor
+from Modules.Plotter import PlotterFactory
+
+
+class ResultCache:
+    """LRU of encoded responses, capped by their total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[tuple, tuple[str, bytes]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[tuple[str, bytes]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, content_type: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key)[1])
+        self.entries[key] = (content_type, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class AnalysisService:
+    """Local HTTP service that keeps the processed frame in memory and answers
+    aggregation and chart requests from it.
+
+    GET /aggregate?group_by=COL[&agg_col=COL][&min_sample_size=N]  -> JSON records
+    GET /chart?plot_type=TYPE&x_col=...[&aggregate_by=COL]        -> PNG
+    GET /status                                                    -> JSON
+
+    Chart parameters are the graph config keys; ``columns`` is comma separated.
+    With ``aggregate_by`` the chart is drawn from the robust aggregation by that
+    column instead of the processed rows. The frame is rebuilt, and the cache
+    cleared, whenever the source file's size or mtime changes.
+    """
+
+    INT_PARAMS = ('min_sample_size', 'large_data_rows')
+
+    def __init__(self, source_path: Path, build_frame: Callable[[], pd.DataFrame], agg_col: str,
+                 min_sample_size: int = 30, cache_max_bytes: int = 256 * 1024 ** 2):
+        self.source_path = Path(source_path)
+        self.build_frame = build_frame
+        self.agg_col = agg_col
+        self.min_sample_size = min_sample_size
+        self.cache = ResultCache(cache_max_bytes)
+        self.df: Optional[pd.DataFrame] = None
+        self.fingerprint: Optional[tuple[int, int]] = None
+        # pandas and matplotlib work runs on one thread, off the event loop.
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        # Created on first use: on Python 3.9 a Lock binds to the loop current at construction, not the serving one.
+        self._reload_lock: Optional[asyncio.Lock] = None
+
+    def _source_fingerprint(self) -> tuple[int, int]:
+        stat = self.source_path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def _current_frame(self) -> pd.DataFrame:
+        if self._reload_lock is None:
+            self._reload_lock = asyncio.Lock()
+        async with self._reload_lock:
+            fingerprint = self._source_fingerprint()
+            if fingerprint != self.fingerprint:
+                print(f"Loading {self.source_path.name}...")
+                self.df = await self._run(self.build_frame)
+                self.fingerprint = fingerprint
+                self.cache.clear()
+            return self.df
+
+    def _aggregate(self, df: pd.DataFrame, group_by_col: str, agg_col: str, min_sample_size: int) -> pd.DataFrame:
+        return DataProcessor(df, copy=False).get_robust_group_aggregation(group_by_col, agg_col, min_sample_size)
+
+    def _aggregate_json(self, df: pd.DataFrame, params: dict) -> tuple[str, bytes]:
+        aggregated = self._aggregate(df, params['group_by'], params.get('agg_col', self.agg_col),
+                                     params.get('min_sample_size', self.min_sample_size))
+        return 'application/json', aggregated.to_json(orient='records').encode()
+
+    def _chart_png(self, df: pd.DataFrame, params: dict) -> tuple[str, bytes]:
+        config = dict(params)
+        if 'columns' in config:
+            config['columns'] = config['columns'].split(',')
+        aggregate_by = config.pop('aggregate_by', None)
+        if aggregate_by is not None:
+            agg_col = config.pop('agg_col', self.agg_col)
+            df = self._aggregate(df, aggregate_by, agg_col, config.pop('min_sample_size', self.min_sample_size))
+            config.setdefault('x_col', aggregate_by)
+            config.setdefault('y_col', agg_col)
+
+        plotter = PlotterFactory.get_plotter(config['plot_type'])
+        buffer = io.BytesIO()
+        plotter.plot(df, buffer, **config)
+        return 'image/png', buffer.getvalue()
+
+    def _status(self) -> tuple[str, bytes]:
+        status = {
+            'source': str(self.source_path),
+            'rows': None if self.df is None else len(self.df),
+            'cache_entries': len(self.cache.entries),
+            'cache_bytes': self.cache.size,
+            'cache_max_bytes': self.cache.max_bytes,
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+        }
+        return 'application/json', json.dumps(status).encode()
+
+    async def respond(self, path: str, params: dict) -> tuple[str, bytes]:
+        if path == '/status':
+            return self._status()
+
+        handlers = {'/aggregate': self._aggregate_json, '/chart': self._chart_png}
+        if path not in handlers:
+            raise FileNotFoundError(f"Unknown endpoint: {path}. Available: {sorted(handlers) + ['/status']}")
+
+        df = await self._current_frame()
+        key = (path, self.fingerprint, tuple(sorted(params.items())))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Identical requests arriving together share one computation.
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        future = asyncio.ensure_future(self._run(handlers[path], df, params))
+        self._inflight[key] = future
+        try:
+            content_type, body = await future
+        finally:
+            del self._inflight[key]
+        if key[1] == self.fingerprint:
+            self.cache.put(key, content_type, body)
+        return content_type, body
+
+    def _parse_params(self, query: str) -> dict:
+        params = dict(parse_qsl(query))
+        for name in self.INT_PARAMS:
+            if name in params:
+                params[name] = int(params[name])
+        return params
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+
+            if len(request_line) < 2 or request_line[0] != 'GET':
+                status, content_type, body = '405 Method Not Allowed', 'text/plain', b'Only GET is supported'
+            else:
+                url = urlsplit(request_line[1])
+                try:
+                    content_type, body = await self.respond(url.path, self._parse_params(url.query))
+                    status = '200 OK'
+                except FileNotFoundError as e:
+                    status, content_type, body = '404 Not Found', 'text/plain', str(e).encode()
+                except (KeyError, ValueError, TypeError) as e:
+                    status, content_type, body = '400 Bad Request', 'text/plain', f"Invalid request: {e!r}".encode()
+                except Exception as e:
+                    status, content_type, body = '500 Internal Server Error', 'text/plain', str(e).encode()
+
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+                         f"Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8000):
+        await self._current_frame()
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"Serving {self.source_path.name} on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+
+class CorrelationAccumulator:
+    """Mergeable pairwise Pearson correlation over chunks, matching ``DataFrame.corr()``.
+
+    Like pandas, every pair of columns uses only the rows where both are
+    non-null. For each pair it keeps the row count, both means, both sums of
+    squared deviations and the co-moment, merged across chunks with the
+    parallel update of Chan et al. All state is k x k.
+    """
+
+    def __init__(self, columns: list[str]):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.count = np.zeros((k, k))
+        # mean[i, j] and m2[i, j] describe column i over the rows where i and j are both present.
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    def update(self, df: pd.DataFrame):
+        values = df[self.columns].to_numpy(dtype=float)
+        present = ~np.isnan(values)
+        if not present.any():
+            return self
+
+        # Chunk statistics are computed on values shifted by their column means to avoid cancellation.
+        column_counts = present.sum(axis=0)
+        shift = np.where(present, values, 0.0).sum(axis=0) / np.maximum(column_counts, 1)
+        centered = np.where(present, values - shift, 0.0)
+        weights = present.astype(float)
+
+        count = weights.T @ weights
+        sums = centered.T @ weights
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, sums / count, 0.0)
+            m2 = (centered ** 2).T @ weights - np.where(count > 0, sums ** 2 / count, 0.0)
+            comoment = centered.T @ centered - np.where(count > 0, sums * sums.T / count, 0.0)
+
+        return self._merge_state(count, mean + shift[:, None], m2, comoment)
+
+    def _merge_state(self, count: np.ndarray, mean: np.ndarray, m2: np.ndarray, comoment: np.ndarray):
+        total = self.count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, self.count * count / total, 0.0)
+            delta = mean - self.mean
+            self.mean = np.where(total > 0, self.mean + delta * count / total, 0.0)
+        self.m2 = self.m2 + m2 + delta ** 2 * weight
+        self.comoment = self.comoment + comoment + delta * delta.T * weight
+        self.count = total
+        return self
+
+    def merge(self, other: 'CorrelationAccumulator'):
+        if other.columns != self.columns:
+            raise ValueError(f"Cannot merge correlations over different columns: {self.columns} and {other.columns}")
+        return self._merge_state(other.count, other.mean, other.m2, other.comoment)
+
+    def corr(self, min_periods: int = 1) -> pd.DataFrame:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        corr[(self.count < max(min_periods, 2)) | (self.m2 <= 0) | (self.m2.T <= 0)] = np.nan
+        corr = np.clip(corr, -1, 1)
+        return pd.DataFrame(corr, index=self.columns, columns=self.columns)
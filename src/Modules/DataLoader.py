@@ -1,17 +1,295 @@
+import hashlib
+import json
+import os
 import pandas as pd
 from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+from Modules.LazyModule import LazyModule
+from Modules.Profiler import profiled
+
+# pyarrow is only needed once the Parquet cache or a columnar table is used.
+pa = LazyModule('pyarrow')
+pq = LazyModule('pyarrow.parquet')
 
 
 class DataLoader:
-    def __init__(self, data_folder: Path):
+    PROBE_ROWS = 1024
+    CACHE_SUFFIX = '.parquet'
+    # Columnar formats read by load_table: Parquet, or Arrow IPC files (.arrow / .feather).
+    TABLE_SUFFIXES = ('.parquet', '.arrow', '.feather')
+    TABLE_ROW_GROUP_ROWS = 128 * 1024
+
+    def __init__(self, data_folder: Path, cache_folder: Optional[Path] = None, cache_max_bytes: int = 2 * 1024 ** 3):
         self.data_folder = data_folder
         if not self.data_folder.exists():
             raise FileNotFoundError(f"Data directory not found: {self.data_folder}")
 
-    def load_csv(self, file_name: str, delimiter: str = ',') -> pd.DataFrame:
+        self.cache_folder = Path(cache_folder) if cache_folder is not None else None
+        self.cache_max_bytes = cache_max_bytes
+        if self.cache_folder is not None:
+            self.cache_folder.mkdir(parents=True, exist_ok=True)
+
+    def _resolve(self, file_name: str) -> Path:
         file_path = self.data_folder / file_name
         if not file_path.exists():
             raise FileNotFoundError(f"File not found: {file_path}")
+        return file_path
+
+    @staticmethod
+    def _parse_options(dtype: Optional[dict], na_values: Optional[Union[list, dict]],
+                       date_formats: Optional[dict[str, str]]) -> dict:
+        # read_csv arguments that type the columns while parsing instead of after the load.
+        options = {'dtype': dtype}
+        if na_values is not None:
+            options['na_values'] = na_values
+        if date_formats:
+            options['parse_dates'] = list(date_formats)
+            options['date_format'] = dict(date_formats)
+        return options
+
+    def _cache_path(self, file_path: Path, delimiter: str, parse_options: dict) -> Path:
+        stat = file_path.stat()
+        key_fields = {
+            'path': str(file_path.resolve()),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'delimiter': delimiter,
+            'dtype': sorted((col, str(col_type)) for col, col_type in (parse_options['dtype'] or {}).items()),
+        }
+        # Only present when used, so caches written with a dtype alone keep their key.
+        if 'na_values' in parse_options:
+            key_fields['na_values'] = json.dumps(parse_options['na_values'], sort_keys=True, default=str)
+        if 'date_format' in parse_options:
+            key_fields['date_formats'] = sorted(parse_options['date_format'].items())
+        key = hashlib.sha256(json.dumps(key_fields).encode()).hexdigest()[:16]
+        return self.cache_folder / f"{file_path.name}.{key}{self.CACHE_SUFFIX}"
+
+    def _projected_columns(self, cache_path: Path, usecols: Optional[list[str]]) -> Optional[list[str]]:
+        if usecols is None:
+            return None
+        schema_names = pq.read_schema(cache_path).names
+        missing_columns = [col for col in usecols if col not in schema_names]
+        if missing_columns:
+            raise ValueError(f"Columns not found in {cache_path.name}: {missing_columns}")
+        return [col for col in schema_names if col in usecols]
+
+    def _evict(self, keep: Path):
+        entries = sorted(self.cache_folder.glob(f"*{self.CACHE_SUFFIX}"), key=lambda entry: entry.stat().st_mtime_ns)
+        total_bytes = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total_bytes <= self.cache_max_bytes:
+                break
+            if entry == keep:
+                continue
+            total_bytes -= entry.stat().st_size
+            entry.unlink()
+
+    def invalidate(self, file_name: Optional[str] = None):
+        if self.cache_folder is None:
+            return
+        pattern = f"{file_name}.*{self.CACHE_SUFFIX}" if file_name else f"*{self.CACHE_SUFFIX}"
+        for entry in self.cache_folder.glob(pattern):
+            entry.unlink()
+
+    def read_columns(self, file_name: str, delimiter: str = ',') -> list[str]:
+        file_path = self._resolve(file_name)
+        if file_path.suffix == '.parquet':
+            return pq.read_schema(file_path).names
+        if file_path.suffix in self.TABLE_SUFFIXES:
+            return pa.ipc.open_file(pa.memory_map(str(file_path))).schema.names
+        return list(pd.read_csv(file_path, delimiter=delimiter, nrows=0).columns)
+
+    @staticmethod
+    def write_table(df: pd.DataFrame, file_path: Path, compression: str = 'zstd'):
+        """Writes `df` with its dtypes as Parquet (compressed, with row-group statistics) or as an Arrow IPC file.
+
+        Arrow IPC files are written uncompressed so that readers can map them without copying.
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if Path(file_path).suffix == '.parquet':
+            pq.write_table(table, file_path, compression=compression, write_statistics=True,
+                           row_group_size=DataLoader.TABLE_ROW_GROUP_ROWS)
+            return
+        with pa.ipc.new_file(str(file_path), table.schema) as writer:
+            writer.write_table(table, max_chunksize=DataLoader.TABLE_ROW_GROUP_ROWS)
+
+    @staticmethod
+    def read_table(file_path: Path, usecols: Optional[list[str]] = None) -> pd.DataFrame:
+        # Memory-mapped: uncompressed Arrow columns become pandas columns without a copy, Parquet skips the read buffer.
+        if Path(file_path).suffix == '.parquet':
+            columns = None
+            if usecols is not None:
+                columns = [col for col in pq.read_schema(file_path).names if col in usecols]
+            table = pq.read_table(file_path, columns=columns, memory_map=True)
+        else:
+            table = pa.ipc.open_file(pa.memory_map(str(file_path))).read_all()
+            if usecols is not None:
+                table = table.select([col for col in table.column_names if col in usecols])
+        return table.to_pandas(split_blocks=True)
+
+    @profiled
+    def load_table(self, file_name: str, usecols: Optional[list[str]] = None) -> pd.DataFrame:
+        return self.read_table(self._resolve(file_name), usecols)
+
+    def table_batches(self, file_name: str) -> int:
+        """Number of row groups (Parquet) or record batches (Arrow IPC) in a table file."""
+        file_path = self._resolve(file_name)
+        if file_path.suffix == '.parquet':
+            return pq.ParquetFile(file_path).metadata.num_row_groups
+        return pa.ipc.open_file(pa.memory_map(str(file_path))).num_record_batches
+
+    def iter_table(self, file_name: str, usecols: Optional[list[str]] = None,
+                   batches: Optional[Iterable[int]] = None) -> Iterator[pd.DataFrame]:
+        """Yields a table file one row group / record batch at a time, or only the batches listed in `batches`."""
+        file_path = self._resolve(file_name)
+        if file_path.suffix == '.parquet':
+            parquet_file = pq.ParquetFile(file_path, memory_map=True)
+            columns = self._projected_columns(file_path, usecols)
+            for index in range(parquet_file.metadata.num_row_groups) if batches is None else batches:
+                yield parquet_file.read_row_group(index, columns=columns).to_pandas()
+            return
+
+        reader = pa.ipc.open_file(pa.memory_map(str(file_path)))
+        columns = None if usecols is None else [col for col in reader.schema.names if col in usecols]
+        for index in range(reader.num_record_batches) if batches is None else batches:
+            batch = reader.get_batch(index)
+            yield (batch if columns is None else batch.select(columns)).to_pandas()
+
+    @profiled
+    def load_csv(self, file_name: str, delimiter: str = ',', usecols: Optional[list[str]] = None,
+                 dtype: Optional[dict] = None, na_values: Optional[Union[list, dict]] = None,
+                 date_formats: Optional[dict[str, str]] = None) -> pd.DataFrame:
+        file_path = self._resolve(file_name)
+        parse_options = self._parse_options(dtype, na_values, date_formats)
+
+        if self.cache_folder is None:
+            return pd.read_csv(file_path, delimiter=delimiter, usecols=usecols, **parse_options)
+
+        cache_path = self._cache_path(file_path, delimiter, parse_options)
+        if cache_path.exists():
+            os.utime(cache_path)
+            return pd.read_parquet(cache_path, columns=self._projected_columns(cache_path, usecols))
+
+        df = pd.read_csv(file_path, delimiter=delimiter, **parse_options)
+        try:
+            df.to_parquet(cache_path, index=False)
+            self._evict(keep=cache_path)
+        except (ValueError, TypeError, pa.ArrowException) as e:
+            cache_path.unlink(missing_ok=True)
+            print(f"--> WARNING: Could not cache '{file_name}': {e}")
+
+        if usecols is not None:
+            missing_columns = [col for col in usecols if col not in df.columns]
+            if missing_columns:
+                raise ValueError(f"Columns not found in {file_path.name}: {missing_columns}")
+            df = df[[col for col in df.columns if col in usecols]]
+        return df
+
+    def iter_csv(self, file_name: str, delimiter: str = ',', chunk_size: int = 100_000,
+                 usecols: Optional[list[str]] = None, max_rows: Optional[int] = None,
+                 max_chunk_bytes: Optional[int] = None, dtype: Optional[dict] = None,
+                 na_values: Optional[Union[list, dict]] = None,
+                 date_formats: Optional[dict[str, str]] = None) -> Iterator[pd.DataFrame]:
+        file_path = self._resolve(file_name)
+        parse_options = self._parse_options(dtype, na_values, date_formats)
+
+        if self.cache_folder is not None:
+            cache_path = self._cache_path(file_path, delimiter, parse_options)
+            if cache_path.exists():
+                os.utime(cache_path)
+                yield from self._iter_cache(cache_path, chunk_size, usecols, max_rows, max_chunk_bytes)
+                return
+            if max_rows is None:
+                yield from self._iter_and_cache(file_path, cache_path, delimiter, chunk_size, usecols, max_chunk_bytes, parse_options)
+                return
+
+        yield from self._iter_source(file_path, delimiter, chunk_size, usecols, max_rows, max_chunk_bytes, parse_options)
+
+    def _iter_source(self, file_path: Path, delimiter: str, chunk_size: int, usecols: Optional[list[str]],
+                     max_rows: Optional[int], max_chunk_bytes: Optional[int], parse_options: dict) -> Iterator[pd.DataFrame]:
+        rows_per_chunk = chunk_size
+        if max_chunk_bytes is not None:
+            rows_per_chunk = min(chunk_size, self.PROBE_ROWS)
+
+        rows_read = 0
+        with pd.read_csv(file_path, delimiter=delimiter, usecols=usecols, iterator=True, **parse_options) as reader:
+            while max_rows is None or rows_read < max_rows:
+                size = rows_per_chunk if max_rows is None else min(rows_per_chunk, max_rows - rows_read)
+                try:
+                    chunk = reader.get_chunk(size)
+                except StopIteration:
+                    break
+                if chunk.empty:
+                    break
+
+                rows_read += len(chunk)
+                if max_chunk_bytes is not None:
+                    bytes_per_row = chunk.memory_usage(deep=True).sum() / len(chunk)
+                    rows_per_chunk = max(1, min(chunk_size, int(max_chunk_bytes // bytes_per_row)))
+
+                yield chunk
+
+    def _iter_cache(self, cache_path: Path, chunk_size: int, usecols: Optional[list[str]],
+                    max_rows: Optional[int], max_chunk_bytes: Optional[int]) -> Iterator[pd.DataFrame]:
+        parquet_file = pq.ParquetFile(cache_path)
+        columns = self._projected_columns(cache_path, usecols)
+
+        batch_size = chunk_size
+        if max_chunk_bytes is not None:
+            row_groups = parquet_file.metadata.num_row_groups
+            if row_groups:
+                probe = parquet_file.read_row_group(0, columns=columns)
+                if probe.num_rows:
+                    bytes_per_row = probe.nbytes / probe.num_rows
+                    batch_size = max(1, min(chunk_size, int(max_chunk_bytes // bytes_per_row)))
+
+        rows_read = 0
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+            chunk = batch.to_pandas()
+            if max_rows is not None and rows_read + len(chunk) > max_rows:
+                chunk = chunk.iloc[:max_rows - rows_read]
+            rows_read += len(chunk)
+            yield chunk
+            if max_rows is not None and rows_read >= max_rows:
+                break
 
-        return pd.read_csv(file_path, delimiter=delimiter)
+    def _iter_and_cache(self, file_path: Path, cache_path: Path, delimiter: str, chunk_size: int,
+                        usecols: Optional[list[str]], max_chunk_bytes: Optional[int],
+                        parse_options: dict) -> Iterator[pd.DataFrame]:
+        partial_path = cache_path.with_name(cache_path.name + '.partial')
+        writer = None
+        complete = False
+        try:
+            for chunk in self._iter_source(file_path, delimiter, chunk_size, None, None, max_chunk_bytes, parse_options):
+                if partial_path is not None:
+                    try:
+                        table = pa.Table.from_pandas(chunk, preserve_index=False)
+                        if writer is None:
+                            writer = pq.ParquetWriter(partial_path, table.schema)
+                        elif not table.schema.equals(writer.schema):
+                            table = table.cast(writer.schema)
+                        writer.write_table(table)
+                    except (ValueError, TypeError, pa.ArrowException) as e:
+                        print(f"--> WARNING: Could not cache '{file_path.name}': {e}")
+                        if writer is not None:
+                            writer.close()
+                            writer = None
+                        partial_path.unlink(missing_ok=True)
+                        partial_path = None
 
+                if usecols is not None:
+                    missing_columns = [col for col in usecols if col not in chunk.columns]
+                    if missing_columns:
+                        raise ValueError(f"Columns not found in {file_path.name}: {missing_columns}")
+                    chunk = chunk[[col for col in chunk.columns if col in usecols]]
+                yield chunk
+            complete = True
+        finally:
+            if writer is not None:
+                writer.close()
+            if partial_path is not None and partial_path.exists():
+                if complete:
+                    partial_path.replace(cache_path)
+                    self._evict(keep=cache_path)
+                else:
+                    partial_path.unlink()
@@ -1,81 +1,474 @@
+import functools
+import inspect
+import numpy as np
 import pandas as pd
-from typing import Any
-from sklearn.preprocessing import MinMaxScaler
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+from Modules.DtypeCompactor import DtypeCompactor
+from Modules.Profiler import profiled
+from Modules.ExecutionPlan import PlanStep, as_list, format_plan, optimize
+from Modules.QuantileSketch import GroupedQuantileSketch
+
+
+def _group_quartiles(df: pd.DataFrame, data_cols: list[str], group_by_col: str,
+                     relative_accuracy: Optional[float] = None) -> tuple[np.ndarray, np.ndarray]:
+    # Row-aligned (rows x columns) Q1/Q3 arrays; rows with a null group key get NaN, as groupby.transform does.
+    if relative_accuracy is not None:
+        sketches = {col: GroupedQuantileSketch(relative_accuracy).update(df[group_by_col], df[col]) for col in data_cols}
+        Q1, Q3 = sketch_group_quartiles(sketches)
+        return broadcast_group_values(Q1, df[group_by_col], data_cols), broadcast_group_values(Q3, df[group_by_col], data_cols)
+
+    codes, uniques = pd.factorize(df[group_by_col])
+    if not len(uniques):
+        empty = np.full((len(df), len(data_cols)), np.nan)
+        return empty, empty.copy()
+
+    quartiles = df[data_cols].groupby(codes).quantile([0.25, 0.75])
+    group_codes = range(len(uniques))
+    has_group = (codes >= 0)[:, None]
+
+    def broadcast(q: float) -> np.ndarray:
+        per_group = quartiles.xs(q, level=-1).reindex(group_codes).to_numpy(dtype=float)
+        return np.where(has_group, per_group[codes], np.nan)
+
+    return broadcast(0.25), broadcast(0.75)
+
+
+def sketch_group_quartiles(sketches: dict[str, GroupedQuantileSketch]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # Per-group Q1 and Q3 (groups x columns) estimated from one sketch per column.
+    quartiles = {col: sketch.quantiles([0.25, 0.75]) for col, sketch in sketches.items()}
+    Q1 = pd.DataFrame({col: col_quartiles[0.25] for col, col_quartiles in quartiles.items()})
+    Q3 = pd.DataFrame({col: col_quartiles[0.75] for col, col_quartiles in quartiles.items()})
+    return Q1, Q3
+
+
+def sketch_group_fences(sketches: dict[str, GroupedQuantileSketch]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    # Per-group IQR fences (groups x columns): Q1 - 1.5 * IQR and Q3 + 1.5 * IQR.
+    Q1, Q3 = sketch_group_quartiles(sketches)
+    IQR = Q3 - Q1
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+
+def fence_mask(df: pd.DataFrame, data_cols: list[str], group_by_col: str,
+               lower_bounds: pd.DataFrame, upper_bounds: pd.DataFrame) -> np.ndarray:
+    # Rows whose values all lie inside their group's fences; unknown groups and nulls are outside.
+    values = df[data_cols].to_numpy(dtype=float)
+    lower = broadcast_group_values(lower_bounds, df[group_by_col], data_cols)
+    upper = broadcast_group_values(upper_bounds, df[group_by_col], data_cols)
+    return ((values >= lower) & (values <= upper)).all(axis=1)
+
+
+def broadcast_group_values(per_group: pd.DataFrame, groups: pd.Series, data_cols: list[str]) -> np.ndarray:
+    # Row-aligned lookup of per-group values; unknown or null groups get NaN.
+    values = np.full((len(per_group) + 1, len(data_cols)), np.nan)
+    if len(per_group):
+        values[:-1] = per_group.reindex(columns=data_cols).to_numpy(dtype=float)
+    codes = per_group.index.get_indexer(groups.to_numpy()) if len(per_group) else np.full(len(groups), -1)
+    return values[codes]
+
+
+def min_max_scale(series: pd.Series, data_min: Optional[float] = None, data_max: Optional[float] = None) -> np.ndarray:
+    # Same arithmetic as sklearn's MinMaxScaler: x * scale + min, nulls kept, and a
+    # (near-)constant column scaled by 1 so it maps to 0. The range defaults to the series' own.
+    values = series.to_numpy(dtype=float)
+    data_min = series.min() if data_min is None else data_min
+    data_max = series.max() if data_max is None else data_max
+    data_range = data_max - data_min
+    scale = 1.0 / data_range if data_range >= 10 * np.finfo(float).eps else 1.0
+    return values * scale + (0 - data_min * scale)
+
+
+def _plannable(method):
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.lazy:
+            return method(self, *args, **kwargs)
+
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        params = dict(bound.arguments)
+        params.pop('self')
+        self.plan.append(PlanStep(method.__name__, params))
+        return self
+
+    return wrapper
 
 
 class DataProcessor:
-    def __init__(self, dataframe: pd.DataFrame):
-        self.df = dataframe.copy()
+    """Fluent cleaning pipeline over a pandas DataFrame.
+
+    By default the input frame is copied and every row filter produces a fresh
+    frame, so nothing the caller holds is ever modified. With ``copy=False`` the
+    processor takes ownership of the input instead: column steps write into it
+    in place until the first row filter, row filters allocate the surviving rows
+    exactly once, and ``build()`` hands back the processor's own frame.
+    """
+
+    def __init__(self, dataframe: pd.DataFrame, lazy: bool = False, copy: bool = True):
+        self.lazy = lazy
+        self.copy = copy
+        self.plan: list[PlanStep] = []
+        self.compaction_report = pd.DataFrame()
+        self._owns_df = not lazy or not copy
+        self.df = dataframe.copy() if self._owns_df and copy else dataframe
+
+    def _optimized_plan(self) -> tuple[list[str], list[PlanStep]]:
+        required_columns, steps = optimize(self.plan)
+        if required_columns is None:
+            return list(self.df.columns), steps
+        return [col for col in self.df.columns if col in required_columns], steps
+
+    def explain(self) -> str:
+        scan_columns, steps = self._optimized_plan()
+        return '\n'.join([
+            format_plan('Logical plan', self.plan),
+            format_plan('Optimized plan', steps, scan_columns),
+        ])
+
+    def _execute(self):
+        if not self.plan:
+            return
 
+        scan_columns, steps = self._optimized_plan()
+        if len(scan_columns) < len(self.df.columns):
+            self.df = self._take_columns(scan_columns)
+        elif not self._owns_df:
+            self.df = self.df.copy()
+        self._owns_df = True
+
+        self.plan = []
+        self.lazy = False
+        try:
+            for step in steps:
+                getattr(self, step.name)(**step.params)
+        finally:
+            self.lazy = True
+
+    def _take_rows(self, mask: pd.Series) -> pd.DataFrame:
+        if self.copy:
+            return self.df[mask].copy()
+        # take() allocates the kept rows once and, unlike boolean indexing, is not flagged as a view.
+        return self.df.take(np.flatnonzero(mask.to_numpy(dtype=bool)))
+
+    def _take_columns(self, columns: list[str]) -> pd.DataFrame:
+        if self.copy:
+            return self.df[columns].copy()
+        missing_columns = [col for col in columns if col not in self.df.columns]
+        if missing_columns:
+            raise KeyError(f"Columns not found: {missing_columns}")
+        return self.df.take(self.df.columns.get_indexer(columns), axis=1)
+
+    @_plannable
+    @profiled
+    def select_columns(self, columns: list[str]):
+        """Keeps only `columns`. The result never shares memory with the previous frame."""
+        self.df = self._take_columns(columns)
+        return self
+
+    @_plannable
+    @profiled
     def rename_columns(self, column_map: dict[str, str]):
+        """Renames in place; the data is shared with the current frame."""
         self.df.rename(columns=column_map, inplace=True)
         return self
 
+    @_plannable
+    @profiled
     def filter_rows(self, column: str, operator: str, value: Any):
+        """Keeps matching rows. The result never shares memory with the previous frame."""
         query_string = f"`{column}` {operator} {repr(value)}"
-        self.df = self.df.query(query_string).copy()
+        if self.copy:
+            self.df = self.df.query(query_string).copy()
+        else:
+            self.df = self._take_rows(self.df.eval(query_string))
+        return self
+
+    @_plannable
+    @profiled
+    def filter_conditions(self, conditions: list[tuple[str, str, Any]]):
+        """Keeps rows matching all conditions in one pass. The result never shares memory with the previous frame."""
+        query_string = ' and '.join(f"(`{column}` {operator} {repr(value)})" for column, operator, value in conditions)
+        if self.copy:
+            self.df = self.df.query(query_string).copy()
+        else:
+            self.df = self._take_rows(self.df.eval(query_string))
         return self
 
+    @_plannable
+    @profiled
     def convert_type(self, column: str, new_type: str):
+        """Replaces `column` in the current frame with a converted copy; other columns are untouched."""
         self.df[column] = self.df[column].astype(new_type)
         return self
 
-    def impute_by_group_mean(self, target_col: str, group_by_col: str):
-        group_means = self.df.groupby(group_by_col)[target_col].transform('mean')
-        self.df[target_col] = self.df[target_col].fillna(group_means)
-        self.df[target_col] = self.df[target_col].fillna(self.df[target_col].mean())
+    @_plannable
+    @profiled
+    def impute_by_group_mean(self, target_col: Union[str, list[str]], group_by_col: str):
+        """Fills nulls in one or more columns with their group mean, in one grouped pass.
+
+        Replaces the target columns in the current frame with filled copies.
+        """
+        target_cols = as_list(target_col)
+        group_means = self.df.groupby(group_by_col, observed=True)[target_cols].transform('mean')
+        filled = self.df[target_cols].fillna(group_means)
+        self.df[target_cols] = filled.fillna(filled.mean())
         return self
 
+    @_plannable
+    @profiled
     def normalize_column(self, column: str):
-        scaler = MinMaxScaler()
-        self.df[column] = scaler.fit_transform(self.df[[column]])
+        """Replaces `column` in the current frame with its values min-max scaled to [0, 1]."""
+        self.df[column] = min_max_scale(self.df[column])
         return self
 
+    @_plannable
+    @profiled
     def map_columns(self, column_maps: dict[str, dict]):
+        """Replaces each mapped column in the current frame with a new one."""
         for col, mapping in column_maps.items():
             if col in self.df.columns:
                 self.df[col] = self.df[col].map(mapping)
         return self
 
+    @_plannable
+    @profiled
     def add_duration_column(self, result_col: str, start_col: str, end_col: str):
+        """Adds `result_col` to the current frame as newly allocated memory."""
         self.df[result_col] = self.df[end_col] - self.df[start_col]
         return self
 
-    def remove_outliers_by_group(self, data_col: str, group_by_col: str):
-        Q1 = self.df.groupby(group_by_col)[data_col].transform('quantile', 0.25)
-        Q3 = self.df.groupby(group_by_col)[data_col].transform('quantile', 0.75)
+    @_plannable
+    @profiled
+    def remove_outliers_by_group(self, data_col: Union[str, list[str]], group_by_col: str,
+                                 relative_accuracy: Optional[float] = None):
+        """Drops rows outside the per-group IQR fences of any of the given columns.
+
+        The group key is factorized once and Q1/Q3 of every column come from a
+        single grouped pass; all fences are computed on the same input frame and
+        applied as one combined mask. With ``relative_accuracy`` the quartiles
+        come from a GroupedQuantileSketch instead of an exact sort. The result
+        never shares memory with the previous frame.
+        """
+        data_cols = as_list(data_col)
+        Q1, Q3 = _group_quartiles(self.df, data_cols, group_by_col, relative_accuracy)
         IQR = Q3 - Q1
 
         lower_bound = Q1 - 1.5 * IQR
         upper_bound = Q3 + 1.5 * IQR
 
-        mask = (self.df[data_col] >= lower_bound) & (self.df[data_col] <= upper_bound)
-        self.df = self.df[mask].copy()
+        values = self.df[data_cols].to_numpy(dtype=float)
+        mask = ((values >= lower_bound) & (values <= upper_bound)).all(axis=1)
+        self.df = self._take_rows(pd.Series(mask, index=self.df.index))
 
         return self
 
-    def get_robust_group_aggregation(self, group_by_col: str, agg_col: str, min_sample_size: int = 30) -> pd.DataFrame:
-        counts = self.df[group_by_col].value_counts()
-        significant_groups = counts[counts >= min_sample_size].index
+    @_plannable
+    @profiled
+    def compact_dtypes(self, category_columns: Optional[list[str]] = None, max_category_ratio: float = 0.5,
+                       downcast_floats: bool = True):
+        """Converts low-cardinality columns to category and downcasts numbers; see DtypeCompactor.
+
+        Replaces the narrowed columns in the current frame. The bytes saved per
+        column are kept in ``compaction_report``.
+        """
+        self.df, self.compaction_report = DtypeCompactor.compact(self.df, category_columns, max_category_ratio, downcast_floats)
+        return self
+
+    def get_robust_group_aggregation(self, group_by_col: str, agg_col: str, min_sample_size: int = 30,
+                                     relative_accuracy: Optional[float] = None) -> pd.DataFrame:
+        return self.get_robust_group_aggregations([group_by_col], agg_col, min_sample_size,
+                                                  relative_accuracy=relative_accuracy)[group_by_col]
+
+    @profiled
+    def get_robust_group_aggregations(self, group_by_cols: list[str], agg_col: Union[str, list[str]],
+                                      min_sample_size: int = 30, stats: Union[str, list[str]] = 'mean',
+                                      sort_ascending: Optional[bool] = None, top_k: Optional[int] = None,
+                                      relative_accuracy: Optional[float] = None) -> dict[str, pd.DataFrame]:
+        """Robust (IQR-filtered) per-group statistics for several group keys in one call.
 
+        Each key copies only the rows of its significant groups and the columns
+        it needs (one ``.loc`` projection), then runs one grouped quartile pass
+        over all aggregation columns and one grouped aggregation; the full
+        frame is never copied. Outliers are masked per aggregation
+        column. With one statistic the output columns keep the aggregation
+        column names, otherwise they are named ``<column>_<stat>``. Set
+        ``sort_ascending`` to sort by the first output column, optionally
+        keeping only ``top_k`` rows (see ``rank_groups``). ``relative_accuracy``
+        switches the quartiles to sketch estimates.
+        """
+        self._execute()
+
+        agg_cols = as_list(agg_col)
+        stat_names = as_list(stats)
+        output_cols = agg_cols if len(stat_names) == 1 else [f"{col}_{stat}" for col in agg_cols for stat in stat_names]
+
+        results = {}
+        for group_by_col in group_by_cols:
+            counts = self.df[group_by_col].value_counts()
+            significant_groups = counts[counts >= min_sample_size].index
+
+            if significant_groups.empty:
+                print(f"--> WARNING: No groups in '{group_by_col}' met the minimum sample size of {min_sample_size}. The resulting aggregation will be empty.")
+                results[group_by_col] = pd.DataFrame(columns=[group_by_col, *output_cols])
+                continue
+
+            in_groups = self.df[group_by_col].isin(significant_groups).to_numpy()
+            subset = self.df.loc[in_groups, list(dict.fromkeys([group_by_col, *agg_cols]))]
+
+            Q1, Q3 = _group_quartiles(subset, agg_cols, group_by_col, relative_accuracy)
+            IQR = Q3 - Q1
+            lower_bound = Q1 - 1.5 * IQR
+            upper_bound = Q3 + 1.5 * IQR
+
+            values = subset[agg_cols].to_numpy(dtype=float)
+            kept = (values >= lower_bound) & (values <= upper_bound)
+            masked = pd.DataFrame(np.where(kept, values, np.nan), columns=agg_cols, index=subset.index)
+            masked[group_by_col] = subset[group_by_col]
+
+            grouped = masked.groupby(group_by_col, observed=True)
+            aggregated_df = grouped[agg_cols].agg(stat_names[0] if len(stat_names) == 1 else stat_names)
+            if len(stat_names) > 1:
+                aggregated_df.columns = output_cols
+            # Groups whose values were all outliers disappear, as when the outlier rows are dropped.
+            aggregated_df = aggregated_df[grouped[agg_cols].count().to_numpy().any(axis=1)].reset_index()
+
+            if sort_ascending is not None:
+                aggregated_df = self.rank_groups(aggregated_df, output_cols[0], ascending=sort_ascending, top_k=top_k)
+            results[group_by_col] = aggregated_df
+
+        return results
+
+    @staticmethod
+    def rank_groups(aggregated_df: pd.DataFrame, by: str, ascending: bool = False, top_k: Optional[int] = None) -> pd.DataFrame:
+        """Sorts an aggregation by `by`; with `top_k`, selects the k largest (or smallest) rows without a full sort."""
+        if top_k is None:
+            return aggregated_df.sort_values(by=by, ascending=ascending)
+        if ascending:
+            return aggregated_df.nsmallest(top_k, by)
+        return aggregated_df.nlargest(top_k, by)
+
+    @profiled
+    def build(self) -> pd.DataFrame:
+        """Returns a copy of the result, or with copy=False the processor's own frame (shared, not copied)."""
+        self._execute()
+        return self.df.copy() if self.copy else self.df
+
+
+class ChunkedDataProcessor:
+    """Runs DataProcessor steps over a re-iterable source of chunks with bounded memory.
+
+    Row-local steps are applied to each chunk independently. Group-wise outlier
+    removal is two-pass: the first pass over the source builds one quantile
+    sketch per column and group, the second applies the resulting IQR fences.
+    """
+
+    def __init__(self, chunk_source: Callable[[], Iterable[pd.DataFrame]]):
+        self.chunk_source = chunk_source
+        self.steps: list[tuple[str, tuple]] = []
+        self._fences: dict[int, tuple[pd.DataFrame, pd.DataFrame]] = {}
+
+    def _add_step(self, name: str, *args):
+        self.steps.append((name, args))
+        return self
+
+    def rename_columns(self, column_map: dict[str, str]):
+        return self._add_step('rename_columns', column_map)
+
+    def filter_rows(self, column: str, operator: str, value: Any):
+        return self._add_step('filter_rows', column, operator, value)
+
+    def convert_type(self, column: str, new_type: str):
+        return self._add_step('convert_type', column, new_type)
+
+    def map_columns(self, column_maps: dict[str, dict]):
+        return self._add_step('map_columns', column_maps)
+
+    def add_duration_column(self, result_col: str, start_col: str, end_col: str):
+        return self._add_step('add_duration_column', result_col, start_col, end_col)
+
+    def remove_outliers_by_group(self, data_col: Union[str, list[str]], group_by_col: str, relative_accuracy: float = 0.01):
+        return self._add_step('remove_outliers_by_group', as_list(data_col), group_by_col, relative_accuracy)
+
+    def _sketch(self, data_cols: list[str], group_by_col: str, relative_accuracy: float,
+                end: int) -> dict[str, GroupedQuantileSketch]:
+        sketches = {col: GroupedQuantileSketch(relative_accuracy) for col in data_cols}
+        for chunk in self._iter_through(end):
+            for col in data_cols:
+                sketches[col].update(chunk[group_by_col], chunk[col])
+        return sketches
+
+    def _fences_for(self, position: int) -> tuple[pd.DataFrame, pd.DataFrame]:
+        if position not in self._fences:
+            _, (data_cols, group_by_col, relative_accuracy) = self.steps[position]
+            self._fences[position] = sketch_group_fences(self._sketch(data_cols, group_by_col, relative_accuracy, position))
+        return self._fences[position]
+
+    def _iter_through(self, end: int) -> Iterator[pd.DataFrame]:
+        # Fences are resolved before reading, so each stateful step costs exactly one extra pass.
+        fences = {position: self._fences_for(position) for position in range(end)
+                  if self.steps[position][0] == 'remove_outliers_by_group'}
+
+        for chunk in self.chunk_source():
+            processor = DataProcessor(chunk)
+            for position, (name, args) in enumerate(self.steps[:end]):
+                if name == 'remove_outliers_by_group':
+                    data_cols, group_by_col, _ = args
+                    mask = fence_mask(processor.df, data_cols, group_by_col, *fences[position])
+                    processor.df = processor.df[mask].copy()
+                else:
+                    getattr(processor, name)(*args)
+            yield processor.build()
+
+    def iter_chunks(self) -> Iterator[pd.DataFrame]:
+        return self._iter_through(len(self.steps))
+
+    def get_robust_group_aggregation(self, group_by_col: str, agg_col: str, min_sample_size: int = 30,
+                                     relative_accuracy: float = 0.01) -> pd.DataFrame:
+        """Streaming counterpart of DataProcessor.get_robust_group_aggregation.
+
+        One pass sketches the quartiles, a second one sums the values inside
+        the fences, so the means are exact for the estimated fences.
+        """
+        counts = pd.Series(dtype='int64')
+        sketch = GroupedQuantileSketch(relative_accuracy)
+        for chunk in self.iter_chunks():
+            counts = counts.add(chunk[group_by_col].value_counts(), fill_value=0)
+            sketch.update(chunk[group_by_col], chunk[agg_col])
+
+        significant_groups = counts[counts >= min_sample_size].index
         if significant_groups.empty:
             print(f"--> WARNING: No groups in '{group_by_col}' met the minimum sample size of {min_sample_size}. The resulting aggregation will be empty.")
             return pd.DataFrame(columns=[group_by_col, agg_col])
 
-        df_filtered = self.df[self.df[group_by_col].isin(significant_groups)].copy()
-
-        Q1 = df_filtered.groupby(group_by_col)[agg_col].transform('quantile', 0.25)
-        Q3 = df_filtered.groupby(group_by_col)[agg_col].transform('quantile', 0.75)
+        Q1, Q3 = sketch_group_quartiles({agg_col: sketch})
         IQR = Q3 - Q1
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
+        lower_bounds = (Q1 - 1.5 * IQR).loc[Q1.index.intersection(significant_groups)]
+        upper_bounds = (Q3 + 1.5 * IQR).loc[lower_bounds.index]
 
-        mask = (df_filtered[agg_col] >= lower_bound) & (df_filtered[agg_col] <= upper_bound)
-        df_no_outliers = df_filtered[mask]
+        totals = None
+        for chunk in self.iter_chunks():
+            values = chunk[agg_col].to_numpy(dtype=float)
+            lower = broadcast_group_values(lower_bounds, chunk[group_by_col], [agg_col])[:, 0]
+            upper = broadcast_group_values(upper_bounds, chunk[group_by_col], [agg_col])[:, 0]
+            kept = chunk.loc[(values >= lower) & (values <= upper), [group_by_col, agg_col]]
+            partial = kept.groupby(group_by_col, observed=True)[agg_col].agg(['sum', 'count'])
+            totals = partial if totals is None else totals.add(partial, fill_value=0)
 
-        aggregated_df = df_no_outliers.groupby(group_by_col)[agg_col].mean().reset_index()
+        if totals is None or totals.empty:
+            return pd.DataFrame(columns=[group_by_col, agg_col])
+        totals = totals[totals['count'] > 0].sort_index()
+        return (totals['sum'] / totals['count']).rename_axis(group_by_col).rename(agg_col).reset_index()
 
-        return aggregated_df
+    def to_csv(self, output_path: Path):
+        header = True
+        for chunk in self.iter_chunks():
+            chunk.to_csv(output_path, mode='w' if header else 'a', header=header, index=False)
+            header = False
 
     def build(self) -> pd.DataFrame:
-        return self.df.copy()
+        chunks = list(self.iter_chunks())
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks, ignore_index=True)
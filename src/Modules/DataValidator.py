@@ -1,21 +1,71 @@
 import pandas as pd
+from typing import Optional, Union
+from Modules.DtypeCompactor import DtypeCompactor
+from Modules.Profiler import profiled
 
 
 class DataValidator:
     @staticmethod
-    def validate(df: pd.DataFrame, required_columns: list[str], data_types: dict[str, str]):
+    def parse_options(data_types: dict[str, str], date_formats: Optional[dict[str, str]] = None,
+                      na_values: Optional[Union[list, dict]] = None, usecols: Optional[list[str]] = None) -> dict:
+        """Keyword arguments for DataLoader.load_csv / iter_csv that apply a schema while parsing.
+
+        Columns are typed by the parser, so ``validate`` on the result only checks
+        them. Dates are parsed only when their format is given; the others are
+        converted by ``validate``.
+        """
+        date_formats = date_formats or {}
+        dtype, dates = {}, {}
+        for col, col_type in data_types.items():
+            if usecols is not None and col not in usecols:
+                continue
+            if col_type != 'datetime':
+                dtype[col] = col_type
+            elif col in date_formats:
+                dates[col] = date_formats[col]
+        return {'dtype': dtype or None, 'na_values': na_values, 'date_formats': dates or None}
+
+    @staticmethod
+    def _has_type(series: pd.Series, dtype: str) -> bool:
+        # Columns typed by the parser or read from typed files already match; converting them again would only copy.
+        if dtype == 'datetime':
+            return pd.api.types.is_datetime64_any_dtype(series.dtype)
+        try:
+            return series.dtype == pd.api.types.pandas_dtype(dtype)
+        except TypeError:
+            return False
+
+    @staticmethod
+    def _date_format(series: pd.Series, date_format: Optional[str]) -> Optional[str]:
+        # Without an explicit format, the one guessed from the first value is used for the whole column.
+        if date_format is not None:
+            return date_format
+        first_valid = series.first_valid_index()
+        if first_valid is None:
+            return None
+        return pd.tseries.api.guess_datetime_format(str(series[first_valid]))
+
+    @staticmethod
+    @profiled
+    def validate(df: pd.DataFrame, required_columns: list[str], data_types: dict[str, str], compact: bool = False,
+                 date_formats: Optional[dict[str, str]] = None):
         missing_columns = [col for col in required_columns if col not in df.columns]
         if missing_columns:
             raise ValueError(f"Missing required columns: {missing_columns}")
 
+        date_formats = date_formats or {}
         for col, dtype in data_types.items():
-            if col in df.columns:
+            if col in df.columns and not DataValidator._has_type(df[col], dtype):
                 try:
                     if dtype == 'datetime':
-                        df[col] = pd.to_datetime(df[col])
+                        date_format = DataValidator._date_format(df[col], date_formats.get(col))
+                        df[col] = pd.to_datetime(df[col], format=date_format, cache=True)
                     else:
                         df[col] = df[col].astype(dtype)
                 except Exception as e:
                     raise TypeError(f"Could not convert column '{col}' to type '{dtype}': {e}")
-        return df
 
+        if compact:
+            # Columns with an explicit type keep it; everything else is narrowed.
+            df, _ = DtypeCompactor.compact(df, columns=[col for col in df.columns if col not in data_types])
+        return df
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+
+class DtypeCompactor:
+    @staticmethod
+    def _compact_series(series: pd.Series, as_category: bool, max_category_ratio: float,
+                        downcast_floats: bool, float_rtol: float) -> pd.Series:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+
+        if as_category:
+            return series.astype('category')
+
+        if pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype):
+            if len(series) and series.nunique() / len(series) <= max_category_ratio:
+                return series.astype('category')
+            return series
+
+        if pd.api.types.is_bool_dtype(series.dtype):
+            return series
+
+        if pd.api.types.is_integer_dtype(series.dtype):
+            return pd.to_numeric(series, downcast='integer')
+
+        if downcast_floats and series.dtype == np.float64:
+            with np.errstate(over='ignore'):
+                narrowed = series.astype(np.float32)
+            if np.allclose(narrowed.to_numpy(dtype=np.float64), series.to_numpy(), rtol=float_rtol, atol=0, equal_nan=True):
+                return narrowed
+
+        return series
+
+    @staticmethod
+    def compact(df: pd.DataFrame, category_columns: Optional[list[str]] = None, max_category_ratio: float = 0.5,
+                downcast_floats: bool = True, float_rtol: float = 1e-6,
+                columns: Optional[list[str]] = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+        category_columns = set(category_columns or [])
+        missing_columns = [col for col in category_columns if col not in df.columns]
+        if missing_columns:
+            raise ValueError(f"Missing required columns: {missing_columns}")
+
+        report_rows = []
+        for col in list(df.columns if columns is None else columns):
+            series = df[col]
+            compacted = DtypeCompactor._compact_series(series, col in category_columns, max_category_ratio,
+                                                       downcast_floats, float_rtol)
+            if compacted is series or compacted.dtype == series.dtype:
+                continue
+
+            bytes_before = int(series.memory_usage(index=False, deep=True))
+            bytes_after = int(compacted.memory_usage(index=False, deep=True))
+            if bytes_after >= bytes_before:
+                continue
+
+            df[col] = compacted
+            report_rows.append({
+                'column': col,
+                'old_dtype': str(series.dtype),
+                'new_dtype': str(compacted.dtype),
+                'bytes_before': bytes_before,
+                'bytes_after': bytes_after,
+                'bytes_saved': bytes_before - bytes_after,
+            })
+
+        report = pd.DataFrame(report_rows, columns=['column', 'old_dtype', 'new_dtype', 'bytes_before', 'bytes_after', 'bytes_saved'])
+        return df, report
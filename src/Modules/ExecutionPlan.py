@@ -0,0 +1,141 @@
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
+
+
+ROW_LOCAL_STEPS = ('rename_columns', 'map_columns', 'convert_type', 'add_duration_column', 'select_columns')
+FILTER_STEPS = ('filter_rows', 'filter_conditions')
+
+
+@dataclass
+class PlanStep:
+    name: str
+    params: dict[str, Any] = field(default_factory=dict)
+
+    def __str__(self):
+        return f"{self.name}({', '.join(f'{key}={_short_repr(value)}' for key, value in self.params.items())})"
+
+
+def _short_repr(value: Any) -> str:
+    if isinstance(value, dict) and len(value) > 3:
+        return f"{{{len(value)} entries}}"
+    return repr(value)
+
+
+def as_list(columns: Union[str, list[str]]) -> list[str]:
+    return [columns] if isinstance(columns, str) else list(columns)
+
+
+def _conditions(step: PlanStep) -> list[tuple[str, str, Any]]:
+    if step.name == 'filter_rows':
+        return [(step.params['column'], step.params['operator'], step.params['value'])]
+    return list(step.params['conditions'])
+
+
+# Rewrites filter conditions so they can run before `step`; None means the filter must stay after it.
+def _filter_before(step: PlanStep, conditions: list[tuple[str, str, Any]]) -> Optional[list[tuple[str, str, Any]]]:
+    if step.name == 'rename_columns':
+        column_map = step.params['column_map']
+        rewritten = []
+        for column, operator, value in conditions:
+            sources = [old for old, new in column_map.items() if new == column]
+            if len(sources) > 1 or (not sources and column in column_map):
+                return None
+            rewritten.append((sources[0] if sources else column, operator, value))
+        return rewritten
+
+    columns = {column for column, _, _ in conditions}
+    if step.name == 'map_columns':
+        return None if columns & set(step.params['column_maps']) else conditions
+    if step.name == 'convert_type':
+        return None if step.params['column'] in columns else conditions
+    if step.name == 'add_duration_column':
+        return None if step.params['result_col'] in columns else conditions
+    if step.name == 'select_columns':
+        return conditions if columns <= set(step.params['columns']) else None
+    return None
+
+
+def push_down_filters(steps: list[PlanStep]) -> list[PlanStep]:
+    optimized: list[PlanStep] = []
+    for step in steps:
+        if step.name not in FILTER_STEPS:
+            optimized.append(step)
+            continue
+
+        conditions = _conditions(step)
+        position = len(optimized)
+        while position > 0 and optimized[position - 1].name in ROW_LOCAL_STEPS:
+            rewritten = _filter_before(optimized[position - 1], conditions)
+            if rewritten is None:
+                break
+            conditions = rewritten
+            position -= 1
+        optimized.insert(position, PlanStep('filter_conditions', {'conditions': conditions}))
+    return optimized
+
+
+def merge_filters(steps: list[PlanStep]) -> list[PlanStep]:
+    merged: list[PlanStep] = []
+    for step in steps:
+        if step.name in FILTER_STEPS and merged and merged[-1].name == 'filter_conditions':
+            merged[-1] = PlanStep('filter_conditions', {'conditions': _conditions(merged[-1]) + _conditions(step)})
+        elif step.name in FILTER_STEPS:
+            merged.append(PlanStep('filter_conditions', {'conditions': _conditions(step)}))
+        else:
+            merged.append(step)
+    return merged
+
+
+# Walks the plan backwards and drops steps whose output is never read. Returns the source
+# columns the plan needs (None when every column reaches the output) and the remaining steps.
+def prune_columns(steps: list[PlanStep]) -> tuple[Optional[set[str]], list[PlanStep]]:
+    required: Optional[set[str]] = None
+    kept: list[PlanStep] = []
+    for step in reversed(steps):
+        params = step.params
+        if step.name == 'select_columns':
+            required = set(params['columns'])
+        elif required is None:
+            pass
+        elif step.name == 'rename_columns':
+            column_map = params['column_map']
+            required = {old for old, new in column_map.items() if new in required} | \
+                       {column for column in required if column not in column_map}
+        elif step.name == 'filter_conditions':
+            required |= {column for column, _, _ in params['conditions']}
+        elif step.name in ('convert_type', 'normalize_column'):
+            if params['column'] not in required:
+                continue
+        elif step.name == 'impute_by_group_mean':
+            target_cols = [col for col in as_list(params['target_col']) if col in required]
+            if not target_cols:
+                continue
+            required |= {params['group_by_col']}
+            step = PlanStep(step.name, {**params, 'target_col': target_cols})
+        elif step.name == 'map_columns':
+            column_maps = {col: mapping for col, mapping in params['column_maps'].items() if col in required}
+            if not column_maps:
+                continue
+            step = PlanStep(step.name, {'column_maps': column_maps})
+        elif step.name == 'add_duration_column':
+            if params['result_col'] not in required:
+                continue
+            required = (required - {params['result_col']}) | {params['start_col'], params['end_col']}
+        elif step.name == 'remove_outliers_by_group':
+            required |= set(as_list(params['data_col'])) | {params['group_by_col']}
+        else:
+            required = None
+        kept.append(step)
+    return required, list(reversed(kept))
+
+
+def optimize(steps: list[PlanStep]) -> tuple[Optional[set[str]], list[PlanStep]]:
+    return prune_columns(merge_filters(push_down_filters(steps)))
+
+
+def format_plan(title: str, steps: list[PlanStep], scan_columns: Optional[list[str]] = None) -> str:
+    lines = [f"== {title} =="]
+    if scan_columns is not None:
+        lines.append(f"  0. scan(columns={scan_columns!r})")
+    lines.extend(f"  {position}. {step}" for position, step in enumerate(steps, start=1))
+    return '\n'.join(lines)
@@ -1,10 +1,17 @@
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
-from Modules.DataLoader import DataLoader
+from typing import Any, Iterable, Optional
+from Modules.CorrelationAccumulator import CorrelationAccumulator
+from Modules.DataLoader import DataLoader, pa
 from Modules.DataValidator import DataValidator
 from Modules.Plotter import PlotterFactory
 
 
 class GraphGenerator:
+    STREAM_CHUNK_ROWS = 100_000
+
     def __init__(self, data_folder: str = 'data', output_folder: str = 'output'):
         self.data_path = Path(data_folder)
         self.output_path = Path(output_folder)
@@ -12,15 +19,8 @@ class GraphGenerator:
         self.loader = DataLoader(self.data_path)
         self.validator = DataValidator()
 
-    def generate(self, config: dict):
-        file_name = config['file_name']
-        plot_type = config['plot_type']
-        output_file_name = config['output_file_name']
-        delimiter = config.get('delimiter', ',')
-        data_types = config.get('data_types', {})
-
-        df = self.loader.load_csv(file_name, delimiter=delimiter)
-
+    @staticmethod
+    def _required_columns(config: dict) -> list[str]:
         required_columns = []
         if 'x_col' in config:
             required_columns.append(config['x_col'])
@@ -28,13 +28,258 @@ class GraphGenerator:
             required_columns.append(config['y_col'])
         if 'columns' in config:
             required_columns.extend(config['columns'])
+        return required_columns
 
-        if required_columns:
-            df = self.validator.validate(df, list(set(required_columns)), data_types)
+    @staticmethod
+    def _projected_columns(configs: list[dict]) -> Optional[list[str]]:
+        columns = set()
+        for config in configs:
+            if config['plot_type'].lower() == 'heatmap' and not config.get('columns'):
+                return None
+            columns.update(GraphGenerator._required_columns(config))
+            if config.get('hue'):
+                columns.add(config['hue'])
+        return sorted(columns)
 
-        plotter = PlotterFactory.get_plotter(plot_type)
-        output_file_path = self.output_path / output_file_name
+    @staticmethod
+    def _is_streamed(config: dict) -> bool:
+        # A heatmap over listed columns only needs their co-moments, so it is accumulated from the source chunk by chunk.
+        return config['plot_type'].lower() == 'heatmap' and bool(config.get('columns'))
+
+    def _load(self, file_name: str, delimiter: str, usecols: Optional[list[str]] = None,
+              data_types: Optional[dict] = None, date_formats: Optional[dict] = None, na_values=None):
+        if Path(file_name).suffix in DataLoader.TABLE_SUFFIXES:
+            return self.loader.load_table(file_name, usecols=usecols)
+
+        # The schema is applied by the parser; validate() then only has to check it.
+        parse_options = DataValidator.parse_options(data_types or {}, date_formats, na_values, usecols)
+        try:
+            return self.loader.load_csv(file_name, delimiter=delimiter, usecols=usecols, **parse_options)
+        except (ValueError, TypeError):
+            # A value the schema cannot parse; read untyped so validate() reports the column as before.
+            return self.loader.load_csv(file_name, delimiter=delimiter, usecols=usecols, na_values=na_values)
+
+    def _plot(self, df, config: dict):
+        plotter = PlotterFactory.get_plotter(config['plot_type'])
+        output_file_path = self.output_path / config['output_file_name']
 
         plot_kwargs = config.copy()
 
         plotter.plot(df, output_file_path, **plot_kwargs)
+
+    def generate(self, config: dict):
+        if self._is_streamed(config):
+            self._plot_streamed(config)
+            return
+
+        file_name = config['file_name']
+        delimiter = config.get('delimiter', ',')
+        data_types = config.get('data_types', {})
+        date_formats = config.get('date_formats', {})
+
+        df = self._load(file_name, delimiter, None, data_types, date_formats, config.get('na_values'))
+
+        required_columns = self._required_columns(config)
+        if required_columns:
+            df = self.validator.validate(df, list(set(required_columns)), data_types, date_formats=date_formats)
+
+        self._plot(df, config)
+
+    def correlate(self, config: dict, executor: Optional[ProcessPoolExecutor] = None, workers: int = 1) -> CorrelationAccumulator:
+        """Accumulates the correlation of ``config['columns']`` over the source without loading it whole.
+
+        CSV sources are read in typed chunks by one reader. Parquet row groups and
+        Arrow record batches are split across ``executor``'s workers when one is
+        given; each worker returns its accumulator and they are merged here.
+        """
+        file_name = config['file_name']
+        delimiter = config.get('delimiter', ',')
+        columns = list(config['columns'])
+        available_columns = self.loader.read_columns(file_name, delimiter=delimiter)
+        missing_columns = [col for col in columns if col not in available_columns]
+        if missing_columns:
+            raise ValueError(f"Missing required columns: {missing_columns}")
+
+        if Path(file_name).suffix not in DataLoader.TABLE_SUFFIXES:
+            parse_options = DataValidator.parse_options(config.get('data_types', {}), config.get('date_formats'),
+                                                        config.get('na_values'), columns)
+            return _accumulate(self.loader.iter_csv(file_name, delimiter, self.STREAM_CHUNK_ROWS, usecols=columns,
+                                                    **parse_options), columns)
+
+        batches = list(range(self.loader.table_batches(file_name)))
+        if executor is None or workers < 2 or len(batches) < 2:
+            return _accumulate(self.loader.iter_table(file_name, columns), columns)
+
+        shares = [batches[index::workers] for index in range(min(workers, len(batches)))]
+        accumulator = CorrelationAccumulator(columns)
+        for partial in executor.map(_correlate_task, [file_name] * len(shares), [columns] * len(shares), shares):
+            accumulator.merge(partial)
+        return accumulator
+
+    def _plot_streamed(self, config: dict, executor: Optional[ProcessPoolExecutor] = None, workers: int = 1):
+        accumulator = self.correlate(config, executor, workers)
+        plotter = PlotterFactory.get_plotter(config['plot_type'])
+        plotter.plot_correlation(accumulator.corr(), self.output_path / config['output_file_name'], **config)
+
+    def _generate_streamed(self, configs: list[dict], workers: int) -> list[str]:
+        failed = []
+        use_pool = workers > 1 and any(Path(config['file_name']).suffix in DataLoader.TABLE_SUFFIXES for config in configs)
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(self.data_path, self.output_path)) if use_pool else nullcontext()
+        with pool as executor:
+            for config in configs:
+                try:
+                    self._plot_streamed(config, executor, workers)
+                except Exception as e:
+                    print(f"Failed to generate graph {config.get('output_file_name', 'N/A')}: {e}")
+                    failed.append(config.get('output_file_name', 'N/A'))
+        return failed
+
+    def _load_group(self, file_name: str, delimiter: str, group_configs: list[dict]):
+        required_columns = set()
+        data_types = {}
+        date_formats = {}
+        na_values = None
+        for config in group_configs:
+            required_columns.update(self._required_columns(config))
+            data_types.update(config.get('data_types', {}))
+            date_formats.update(config.get('date_formats', {}))
+            na_values = config.get('na_values', na_values)
+
+        usecols = self._projected_columns(group_configs)
+        if usecols is not None:
+            available_columns = self.loader.read_columns(file_name, delimiter=delimiter)
+            usecols = [col for col in usecols if col in available_columns]
+            required_columns &= set(available_columns)
+
+        df = self._load(file_name, delimiter, usecols, data_types, date_formats, na_values)
+        if required_columns:
+            df = self.validator.validate(df, sorted(required_columns), data_types, date_formats=date_formats)
+        return df
+
+    def _render(self, df, config: dict):
+        self.validator.validate(df, self._required_columns(config), {})
+        self._plot(df, config)
+
+    @staticmethod
+    def _group_configs(configs: list[dict]) -> dict[tuple[str, str], list[dict]]:
+        groups: dict[tuple[str, str], list[dict]] = {}
+        for config in configs:
+            key = (config['file_name'], config.get('delimiter', ','))
+            groups.setdefault(key, []).append(config)
+        return groups
+
+    def generate_many(self, configs: list[dict], workers: Optional[int] = None) -> list[str]:
+        failed = self._generate_streamed([config for config in configs if self._is_streamed(config)], workers or 1)
+        groups = self._group_configs([config for config in configs if not self._is_streamed(config)])
+        if workers is not None and workers > 1:
+            return failed + self._generate_parallel(groups, workers)
+
+        for (file_name, delimiter), group_configs in groups.items():
+            try:
+                df = self._load_group(file_name, delimiter, group_configs)
+            except Exception as e:
+                for config in group_configs:
+                    print(f"Failed to generate graph {config.get('output_file_name', 'N/A')}: {e}")
+                    failed.append(config.get('output_file_name', 'N/A'))
+                continue
+
+            for config in group_configs:
+                try:
+                    self._render(df, config)
+                except Exception as e:
+                    print(f"Failed to generate graph {config.get('output_file_name', 'N/A')}: {e}")
+                    failed.append(config.get('output_file_name', 'N/A'))
+
+        return failed
+
+    def _share_group(self, file_name: str, delimiter: str, group_configs: list[dict], shared_path: Path) -> Optional[Path]:
+        # Arrow IPC sources without schemas are mapped directly; anything else is parsed and validated once
+        # here and written as an uncompressed Arrow file, whose pages all workers share through the OS cache.
+        if Path(file_name).suffix in ('.arrow', '.feather') and not any(config.get('data_types') for config in group_configs):
+            return self.data_path / file_name
+
+        df = self._load_group(file_name, delimiter, group_configs)
+        try:
+            DataLoader.write_table(df, shared_path)
+        except (ValueError, TypeError, pa.ArrowException) as e:
+            print(f"--> WARNING: Could not share '{file_name}' with the workers, each one will load it: {e}")
+            shared_path.unlink(missing_ok=True)
+            return None
+        return shared_path
+
+    def _generate_parallel(self, groups: dict[tuple[str, str], list[dict]], workers: int) -> list[str]:
+        # Each source is loaded once, in this process; tasks carry only configs and the path of the shared frame.
+        failed = []
+        with tempfile.TemporaryDirectory() as shared_folder:
+            tasks = []
+            for index, ((file_name, delimiter), group_configs) in enumerate(groups.items()):
+                try:
+                    shared_path = self._share_group(file_name, delimiter, group_configs, Path(shared_folder) / f'{index}.arrow')
+                except Exception as e:
+                    for config in group_configs:
+                        print(f"Failed to generate graph {config.get('output_file_name', 'N/A')}: {e}")
+                        failed.append(config.get('output_file_name', 'N/A'))
+                    continue
+                tasks.extend((file_name, delimiter, group_configs, config, shared_path) for config in group_configs)
+            if not tasks:
+                return failed
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker,
+                                     initargs=(self.data_path, self.output_path)) as executor:
+                for output_file_name, error in executor.map(_render_task, *zip(*tasks)):
+                    if error is not None:
+                        print(f"Failed to generate graph {output_file_name}: {error}")
+                        failed.append(output_file_name)
+
+        return failed
+
+
+_worker_generator: Optional[GraphGenerator] = None
+_worker_frames: dict[tuple[str, str], Any] = {}
+
+
+def _init_worker(data_folder: Path, output_folder: Path):
+    import matplotlib
+    matplotlib.use('Agg')
+
+    global _worker_generator
+    _worker_generator = GraphGenerator(data_folder, output_folder)
+    _worker_frames.clear()
+
+
+def _accumulate(chunks: Iterable, columns: list[str]) -> CorrelationAccumulator:
+    accumulator = CorrelationAccumulator(columns)
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator
+
+
+def _correlate_task(file_name: str, columns: list[str], batches: list[int]) -> CorrelationAccumulator:
+    return _accumulate(_worker_generator.loader.iter_table(file_name, columns, batches), columns)
+
+
+def _render_task(file_name: str, delimiter: str, group_configs: list[dict], config: dict,
+                 shared_path: Optional[Path]) -> tuple[str, Optional[str]]:
+    output_file_name = config.get('output_file_name', 'N/A')
+    key = (file_name, delimiter)
+    try:
+        if key not in _worker_frames:
+            try:
+                if shared_path is not None:
+                    # Memory-mapped: numeric columns are views of the shared pages, not per-worker copies.
+                    _worker_frames[key] = DataLoader.read_table(shared_path, GraphGenerator._projected_columns(group_configs))
+                else:
+                    _worker_frames[key] = _worker_generator._load_group(file_name, delimiter, group_configs)
+            except Exception as e:
+                _worker_frames[key] = e
+
+        df = _worker_frames[key]
+        if isinstance(df, Exception):
+            raise df
+
+        _worker_generator._render(df, config)
+    except Exception as e:
+        return output_file_name, str(e)
+
+    return output_file_name, None
@@ -0,0 +1,16 @@
+import importlib
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """Placeholder for a heavy module that is imported on first attribute access."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        # Only called for attributes the placeholder itself does not have.
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return getattr(self._module, attr)
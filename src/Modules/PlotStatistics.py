@@ -0,0 +1,144 @@
+import weakref
+import numpy as np
+import pandas as pd
+from typing import Any, Callable
+
+
+def category_order(values: pd.Series) -> list:
+    # Same order seaborn uses: categories first, numbers sorted, anything else by appearance.
+    observed = values.dropna().unique()
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return [category for category in values.cat.categories if category in set(observed)]
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return sorted(observed)
+    return list(observed)
+
+
+def _grouped_values(df: pd.DataFrame, x_col: str, y_col: str) -> tuple[np.ndarray, np.ndarray, list]:
+    data = df[[x_col, y_col]].dropna()
+    order = category_order(data[x_col])
+    codes = pd.Categorical(data[x_col], categories=order).codes
+    return codes.astype(np.int64), data[y_col].to_numpy(dtype=float), order
+
+
+def box_stats(df: pd.DataFrame, x_col: str, y_col: str, whis: float = 1.5, max_fliers: int = 200) -> list[dict]:
+    """Per-group statistics in the format of ``Axes.bxp``, from one grouped pass over the rows.
+
+    Whiskers reach the most extreme values within ``whis`` IQRs of the box.
+    Fliers are capped at ``max_fliers`` evenly spaced values per group.
+    """
+    codes, values, order = _grouped_values(df, x_col, y_col)
+    if not len(values):
+        return []
+    grouped = pd.Series(values).groupby(codes)
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    means = grouped.mean()
+    q1, q3 = quartiles[0.25].to_numpy(), quartiles[0.75].to_numpy()
+    iqr = q3 - q1
+
+    positions = quartiles.index.to_numpy()
+    lower = np.full(len(order), np.nan)
+    upper = np.full(len(order), np.nan)
+    lower[positions], upper[positions] = q1 - whis * iqr, q3 + whis * iqr
+    inside = (values >= lower[codes]) & (values <= upper[codes])
+    whiskers = pd.Series(values[inside]).groupby(codes[inside]).agg(['min', 'max'])
+
+    fliers = {}
+    outside_codes, outside_values = codes[~inside], values[~inside]
+    for code in np.unique(outside_codes):
+        group_fliers = np.sort(outside_values[outside_codes == code])
+        if len(group_fliers) > max_fliers:
+            group_fliers = group_fliers[np.linspace(0, len(group_fliers) - 1, max_fliers).astype(int)]
+        fliers[code] = group_fliers
+
+    return [{
+        'label': str(order[code]),
+        'mean': means[code],
+        'med': quartiles.at[code, 0.5],
+        'q1': quartiles.at[code, 0.25],
+        'q3': quartiles.at[code, 0.75],
+        'whislo': whiskers.at[code, 'min'] if code in whiskers.index else quartiles.at[code, 0.25],
+        'whishi': whiskers.at[code, 'max'] if code in whiskers.index else quartiles.at[code, 0.75],
+        'fliers': fliers.get(code, np.empty(0)),
+    } for code in positions]
+
+
+def violin_stats(df: pd.DataFrame, x_col: str, y_col: str, points: int = 100, cut: float = 2,
+                 grid_bins: int = 2048) -> list[dict]:
+    """Per-group densities in the format of ``Axes.violin``.
+
+    Every value is counted once into a fine shared grid; each group's counts
+    are then smoothed with a Gaussian kernel of Scott's bandwidth, so the cost
+    after the single pass depends on the number of groups and grid bins only.
+    """
+    codes, values, order = _grouped_values(df, x_col, y_col)
+    if not len(values):
+        return []
+    grouped = pd.Series(values).groupby(codes)
+    summary = grouped.agg(['count', 'std', 'min', 'max', 'mean', 'median'])
+    bandwidths = (summary['std'].fillna(0) * summary['count'] ** (-1 / 5)).to_numpy()
+
+    low = (summary['min'] - cut * bandwidths).min()
+    high = (summary['max'] + cut * bandwidths).max()
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    bin_width = (high - low) / grid_bins
+    bins = np.clip(((values - low) / bin_width).astype(np.int64), 0, grid_bins - 1)
+    counts = np.bincount(codes * grid_bins + bins, minlength=len(order) * grid_bins).reshape(len(order), grid_bins)
+    centers = low + (np.arange(grid_bins) + 0.5) * bin_width
+
+    stats = []
+    for position, (code, row) in enumerate(summary.iterrows()):
+        bandwidth = bandwidths[position]
+        if bandwidth > 0:
+            sigma = max(bandwidth / bin_width, 0.5)
+            offsets = np.arange(-int(4 * sigma) - 1, int(4 * sigma) + 2)
+            kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+            # 'full' and the centred window, as 'same' would return the kernel's length when it is wider than the grid.
+            smoothed = np.convolve(counts[code], kernel / kernel.sum(), mode='full')[len(offsets) // 2:][:grid_bins]
+            smoothed = smoothed / (row['count'] * bin_width)
+            coords = np.linspace(row['min'] - cut * bandwidth, row['max'] + cut * bandwidth, points)
+            density = np.interp(coords, centers, smoothed)
+        else:
+            coords = np.array([row['min'] - 0.5, row['min'], row['min'] + 0.5])
+            density = np.array([0.0, 1.0, 0.0])
+
+        stats.append({
+            'label': str(order[code]),
+            'coords': coords,
+            'vals': density,
+            'mean': row['mean'],
+            'median': row['median'],
+            'min': row['min'],
+            'max': row['max'],
+        })
+    return stats
+
+
+class GroupSummaryCache:
+    """Summaries computed for a frame, reused by every chart drawn from that same frame object.
+
+    Entries live as long as the frame does; frames must not be mutated between charts.
+    """
+
+    _entries: dict[int, dict] = {}
+
+    @classmethod
+    def get(cls, df: pd.DataFrame, key: tuple, compute: Callable[[], Any]) -> Any:
+        frame_id = id(df)
+        if frame_id not in cls._entries:
+            cls._entries[frame_id] = {}
+            weakref.finalize(df, cls._entries.pop, frame_id, None)
+
+        entries = cls._entries[frame_id]
+        if key not in entries:
+            entries[key] = compute()
+        return entries[key]
+
+    @classmethod
+    def box_stats(cls, df: pd.DataFrame, x_col: str, y_col: str) -> list[dict]:
+        return cls.get(df, ('box', x_col, y_col), lambda: box_stats(df, x_col, y_col))
+
+    @classmethod
+    def violin_stats(cls, df: pd.DataFrame, x_col: str, y_col: str) -> list[dict]:
+        return cls.get(df, ('violin', x_col, y_col), lambda: violin_stats(df, x_col, y_col))
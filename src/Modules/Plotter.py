@@ -1,17 +1,81 @@
 from abc import ABC, abstractmethod
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from pathlib import Path
+from Modules.LazyModule import LazyModule
+from Modules.PlotStatistics import GroupSummaryCache
+from Modules.Profiler import profiled
 from typing import Optional, List
 import numpy as np
 
+# The plotting stack is imported on first use, so runs that never plot do not pay for it.
+sns = LazyModule('seaborn')
+figure = LazyModule('matplotlib.figure')
+lines = LazyModule('matplotlib.lines')
+
 
 class Plotter(ABC):
+    # Row count above which a plotter switches to its aggregated rendering; None keeps seaborn for every size.
+    LARGE_DATA_ROWS: Optional[int] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'plot' in cls.__dict__:
+            cls.plot = profiled(cls.plot)
+
     @abstractmethod
     def plot(self, df: pd.DataFrame, output_path: Path, **kwargs):
         pass
 
+    def _is_large(self, df: pd.DataFrame, kwargs: dict) -> bool:
+        threshold = kwargs.get('large_data_rows', self.LARGE_DATA_ROWS)
+        return threshold is not None and len(df) > threshold
+
+    @staticmethod
+    def _rotate_xticks(ax, rotation: int = 45, ha: str = 'right'):
+        for label in ax.get_xticklabels():
+            label.set_rotation(rotation)
+            label.set_horizontalalignment(ha)
+
+
+def _bin_edges(values: np.ndarray, bins: int) -> np.ndarray:
+    low, high = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+def _gaussian_kde(sample: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    # Gaussian KDE with Scott's bandwidth, as seaborn uses by default.
+    if len(sample) < 2 or sample.std(ddof=1) == 0:
+        return np.zeros_like(grid)
+    bandwidth = sample.std(ddof=1) * len(sample) ** (-1 / 5)
+    density = np.zeros_like(grid)
+    for start in range(0, len(sample), 4096):
+        block = (grid[:, None] - sample[None, start:start + 4096]) / bandwidth
+        density += np.exp(-0.5 * block ** 2).sum(axis=1)
+    return density / (len(sample) * bandwidth * np.sqrt(2 * np.pi))
+
+
+def _lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    # Largest-Triangle-Three-Buckets: indices of n_out points that keep the visual shape of a sorted series.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(areas.argmax())
+        selected[bucket + 1] = previous
+    return selected
+
 
 class BarPlotter(Plotter):
     def plot(self, df: pd.DataFrame, output_path: Path, **kwargs):
@@ -21,18 +85,21 @@ class BarPlotter(Plotter):
         xlabel = kwargs.get('xlabel')
         ylabel = kwargs.get('ylabel')
 
-        plt.figure(figsize=(12, 8))
-        sns.barplot(data=df, x=x_col, y=y_col)
-        plt.title(title)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.close()
+        fig = figure.Figure(figsize=(12, 8))
+        ax = fig.subplots()
+        sns.barplot(data=df, x=x_col, y=y_col, ax=ax)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        self._rotate_xticks(ax)
+        fig.tight_layout()
+        fig.savefig(output_path)
 
 
 class LinePlotter(Plotter):
+    LARGE_DATA_ROWS = 100_000
+    MAX_POINTS = 2_000
+
     def plot(self, df: pd.DataFrame, output_path: Path, **kwargs):
         x_col = kwargs.get('x_col')
         y_col = kwargs.get('y_col')
@@ -40,18 +107,38 @@ class LinePlotter(Plotter):
         xlabel = kwargs.get('xlabel')
         ylabel = kwargs.get('ylabel')
 
-        plt.figure(figsize=(12, 6))
-        sns.lineplot(data=df, x=x_col, y=y_col, marker='o')
-        plt.title(title)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.close()
+        fig = figure.Figure(figsize=(12, 6))
+        ax = fig.subplots()
+        if self._is_large(df, kwargs):
+            self._plot_downsampled(ax, df, x_col, y_col)
+        else:
+            sns.lineplot(data=df, x=x_col, y=y_col, marker='o', ax=ax)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        self._rotate_xticks(ax)
+        fig.tight_layout()
+        fig.savefig(output_path)
+
+    def _plot_downsampled(self, ax, df: pd.DataFrame, x_col: str, y_col: str):
+        # Repeated x values are reduced to their mean with a normal 95% band (seaborn bootstraps it),
+        # then LTTB keeps at most MAX_POINTS points.
+        stats = df.groupby(x_col, observed=True, sort=True)[y_col].agg(['mean', 'sem', 'count'])
+        x = stats.index.to_numpy()
+        mean = stats['mean'].to_numpy(dtype=float)
+        keep = _lttb(np.arange(len(x), dtype=float), mean, self.MAX_POINTS)
+
+        colour = sns.color_palette()[0]
+        if (stats['count'] > 1).any():
+            band = 1.96 * stats['sem'].fillna(0).to_numpy()
+            ax.fill_between(x[keep], (mean - band)[keep], (mean + band)[keep], color=colour, alpha=0.2, linewidth=0)
+        ax.plot(x[keep], mean[keep], color=colour, marker='o' if len(keep) <= 200 else None)
 
 
 class ScatterPlotter(Plotter):
+    LARGE_DATA_ROWS = 50_000
+    DENSITY_BINS = 300
+
     def plot(self, df: pd.DataFrame, output_path: Path, **kwargs):
         x_col = kwargs.get('x_col')
         y_col = kwargs.get('y_col')
@@ -60,31 +147,89 @@ class ScatterPlotter(Plotter):
         ylabel = kwargs.get('ylabel')
         hue = kwargs.get('hue')
 
-        plt.figure(figsize=(12, 8))
-        sns.scatterplot(data=df, x=x_col, y=y_col, hue=hue, alpha=0.6)
-        plt.title(title)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.close()
+        fig = figure.Figure(figsize=(12, 8))
+        ax = fig.subplots()
+        if self._is_large(df, kwargs):
+            self._plot_density(ax, df, x_col, y_col, hue)
+        else:
+            sns.scatterplot(data=df, x=x_col, y=y_col, hue=hue, alpha=0.6, ax=ax)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        fig.tight_layout()
+        fig.savefig(output_path)
+
+    def _plot_density(self, ax, df: pd.DataFrame, x_col: str, y_col: str, hue: Optional[str]):
+        # One 2D histogram per hue level on shared bins, drawn as a raster whose opacity follows log(count).
+        data = df.dropna(subset=[x_col, y_col])
+        x = data[x_col].to_numpy(dtype=float)
+        y = data[y_col].to_numpy(dtype=float)
+        x_edges = _bin_edges(x, self.DENSITY_BINS)
+        y_edges = _bin_edges(y, self.DENSITY_BINS)
+        extent = (x_edges[0], x_edges[-1], y_edges[0], y_edges[-1])
+
+        if hue:
+            codes, levels = pd.factorize(data[hue], sort=True)
+        else:
+            codes, levels = np.zeros(len(data), dtype=int), [None]
+
+        handles = []
+        for code, (level, colour) in enumerate(zip(levels, sns.color_palette(n_colors=len(levels)))):
+            counts, _, _ = np.histogram2d(x[codes == code], y[codes == code], bins=[x_edges, y_edges])
+            if not counts.any():
+                continue
+            layer = np.zeros(counts.T.shape + (4,))
+            layer[..., :3] = colour
+            layer[..., 3] = 0.85 * np.log1p(counts.T) / np.log1p(counts.max())
+            ax.imshow(layer, origin='lower', extent=extent, aspect='auto', interpolation='nearest')
+            handles.append(lines.Line2D([], [], marker='o', linestyle='', color=colour, label=str(level)))
+
+        if hue and handles:
+            ax.legend(handles=handles, title=hue)
 
 
 class HistogramPlotter(Plotter):
+    LARGE_DATA_ROWS = 200_000
+    KDE_SAMPLE_SIZE = 20_000
+    MAX_BINS = 200
+
     def plot(self, df: pd.DataFrame, output_path: Path, **kwargs):
         x_col = kwargs.get('x_col')
         title = kwargs.get('title')
         xlabel = kwargs.get('xlabel')
         ylabel = kwargs.get('ylabel')
 
-        plt.figure(figsize=(10, 6))
-        sns.histplot(data=df, x=x_col, kde=True)
-        plt.title(title)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel if ylabel else 'Frequency')
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.close()
+        fig = figure.Figure(figsize=(10, 6))
+        ax = fig.subplots()
+        if self._is_large(df, kwargs):
+            self._plot_binned(ax, df[x_col])
+        else:
+            sns.histplot(data=df, x=x_col, kde=True, ax=ax)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel if ylabel else 'Frequency')
+        fig.tight_layout()
+        fig.savefig(output_path)
+
+    def _plot_binned(self, ax, series: pd.Series):
+        # NumPy bins over every value; the KDE comes from a fixed-size sample, scaled to counts.
+        values = series.dropna().to_numpy(dtype=float)
+        if not len(values):
+            return
+        edges = np.histogram_bin_edges(values, bins='auto')
+        if len(edges) > self.MAX_BINS + 1:
+            edges = np.linspace(edges[0], edges[-1], self.MAX_BINS + 1)
+        counts, edges = np.histogram(values, bins=edges)
+        colour = sns.color_palette()[0]
+        ax.stairs(counts, edges, fill=True, color=colour, alpha=0.75)
+        ax.stairs(counts, edges, color='white', linewidth=0.5)
+
+        sample = values
+        if len(values) > self.KDE_SAMPLE_SIZE:
+            sample = np.random.default_rng(0).choice(values, self.KDE_SAMPLE_SIZE, replace=False)
+        grid = np.linspace(edges[0], edges[-1], 200)
+        density = _gaussian_kde(sample, grid)
+        ax.plot(grid, density * len(values) * np.diff(edges).mean(), color=colour)
 
 
 class BoxPlotter(Plotter):
@@ -95,15 +240,23 @@ class BoxPlotter(Plotter):
         xlabel = kwargs.get('xlabel')
         ylabel = kwargs.get('ylabel')
 
-        plt.figure(figsize=(14, 8))
-        sns.boxplot(data=df, x=x_col, y=y_col)
-        plt.title(title)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.close()
+        fig = figure.Figure(figsize=(14, 8))
+        ax = fig.subplots()
+        stats = GroupSummaryCache.box_stats(df, x_col, y_col)
+        colour = sns.color_palette()[0]
+        # Without any values the axes are left empty, as seaborn drew them.
+        if stats:
+            ax.bxp(stats, positions=range(len(stats)), widths=0.8, patch_artist=True,
+                   boxprops={'facecolor': colour, 'edgecolor': '0.2'}, medianprops={'color': '0.2'},
+                   whiskerprops={'color': '0.2'}, capprops={'color': '0.2'},
+                   flierprops={'marker': 'd', 'markerfacecolor': '0.2', 'markeredgecolor': '0.2', 'markersize': 4})
+            ax.set_xticks(range(len(stats)), [box['label'] for box in stats])
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        self._rotate_xticks(ax)
+        fig.tight_layout()
+        fig.savefig(output_path)
 
 
 class ViolinPlotter(Plotter):
@@ -114,38 +267,55 @@ class ViolinPlotter(Plotter):
         xlabel = kwargs.get('xlabel')
         ylabel = kwargs.get('ylabel')
 
-        plt.figure(figsize=(14, 8))
-        sns.violinplot(data=df, x=x_col, y=y_col)
-        plt.title(title)
-        plt.xlabel(xlabel)
-        plt.ylabel(ylabel)
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.close()
+        fig = figure.Figure(figsize=(14, 8))
+        ax = fig.subplots()
+        stats = GroupSummaryCache.violin_stats(df, x_col, y_col)
+        boxes = GroupSummaryCache.box_stats(df, x_col, y_col)
+        positions = np.arange(len(stats))
+        colour = sns.color_palette()[0]
+        if stats:
+            bodies = ax.violin(stats, positions=positions, widths=0.8, showextrema=False)
+            for body in bodies['bodies']:
+                body.set_facecolor(colour)
+                body.set_edgecolor('0.2')
+                body.set_alpha(1)
+            # Inner box as seaborn draws it: whiskers, interquartile bar and a white median dot.
+            ax.vlines(positions, [box['whislo'] for box in boxes], [box['whishi'] for box in boxes], color='0.2', linewidth=1.5)
+            ax.vlines(positions, [box['q1'] for box in boxes], [box['q3'] for box in boxes], color='0.2', linewidth=6)
+            ax.scatter(positions, [box['med'] for box in boxes], color='white', s=15, zorder=3)
+            ax.set_xticks(positions, [violin['label'] for violin in stats])
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        self._rotate_xticks(ax)
+        fig.tight_layout()
+        fig.savefig(output_path)
 
 
 class HeatmapPlotter(Plotter):
     def plot(self, df: pd.DataFrame, output_path: Path, **kwargs):
-        title = kwargs.get('title')
         columns = kwargs.get('columns')
 
-        plt.figure(figsize=(12, 10))
-
         if columns:
             data_to_correlate = df[columns]
         else:
             data_to_correlate = df.select_dtypes(include=np.number)
 
-        corr = data_to_correlate.corr()
+        self.plot_correlation(data_to_correlate.corr(), output_path, **kwargs)
+
+    def plot_correlation(self, corr: pd.DataFrame, output_path: Path, **kwargs):
+        # Entry point for correlations computed without loading the frame (GraphGenerator's streamed heatmaps).
+        title = kwargs.get('title')
+
+        fig = figure.Figure(figsize=(12, 10))
+        ax = fig.subplots()
 
-        sns.heatmap(corr, annot=True, cmap='coolwarm', fmt=".2f", annot_kws={"size": 10})
-        plt.title(title, fontsize=16)
-        plt.xticks(rotation=45, ha='right')
-        plt.yticks(rotation=0)
-        plt.tight_layout()
-        plt.savefig(output_path)
-        plt.close()
+        sns.heatmap(corr, annot=True, cmap='coolwarm', fmt=".2f", annot_kws={"size": 10}, ax=ax)
+        ax.set_title(title, fontsize=16)
+        self._rotate_xticks(ax)
+        ax.tick_params(axis='y', labelrotation=0)
+        fig.tight_layout()
+        fig.savefig(output_path)
 
 
 class PlotterFactory:
@@ -0,0 +1,131 @@
+import cProfile
+import functools
+import json
+import time
+import tracemalloc
+import pandas as pd
+from pathlib import Path
+from typing import Any, Optional
+
+
+class Profiler:
+    """Process-wide recorder of wall time, CPU time, peak memory and row counts per stage.
+
+    Disabled by default: an instrumented call then costs a single attribute
+    check. Memory is measured with tracemalloc, which only runs while enabled.
+    """
+
+    enabled = False
+    records: list[dict] = []
+    profile_stage: Optional[str] = None
+    profile_output: Optional[Path] = None
+    _peaks: list[int] = []
+    _profile: Optional[cProfile.Profile] = None
+
+    @classmethod
+    def enable(cls, profile_stage: Optional[str] = None, profile_output: Optional[Path] = None):
+        cls.enabled = True
+        cls.records = []
+        cls._peaks = []
+        cls.profile_stage = profile_stage
+        cls.profile_output = Path(profile_output or f'{profile_stage}.prof') if profile_stage else None
+        # One cProfile instance accumulates every call of the profiled stage.
+        cls._profile = cProfile.Profile() if profile_stage else None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def disable(cls):
+        cls.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def _rows(value: Any) -> Optional[int]:
+        if isinstance(value, pd.DataFrame):
+            return len(value)
+        frame = getattr(value, 'df', None)
+        return len(frame) if isinstance(frame, pd.DataFrame) else None
+
+    @classmethod
+    def _rows_in(cls, args: tuple) -> Optional[int]:
+        for arg in args:
+            rows = cls._rows(arg)
+            if rows is not None:
+                return rows
+        return None
+
+    @classmethod
+    def call(cls, stage: str, func, args: tuple, kwargs: dict):
+        rows_in = cls._rows_in(args)
+        current_before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        cls._peaks.append(0)
+
+        profile = cls._profile if stage == cls.profile_stage else None
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            if profile is not None:
+                result = profile.runcall(func, *args, **kwargs)
+            else:
+                result = func(*args, **kwargs)
+        finally:
+            wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+            _, peak = tracemalloc.get_traced_memory()
+            # Nested calls reset the tracemalloc peak, so their peaks are carried up explicitly.
+            peak = max(peak, cls._peaks.pop())
+            if cls._peaks:
+                cls._peaks[-1] = max(cls._peaks[-1], peak)
+            if profile is not None:
+                profile.dump_stats(cls.profile_output)
+
+        # Methods that return self report the rows of the frame they hold.
+        rows_out = cls._rows(result)
+        if rows_out is None and args:
+            rows_out = cls._rows(args[0])
+
+        cls.records.append({
+            'stage': stage,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'peak_memory_bytes': max(peak - current_before, 0),
+            'rows_in': rows_in,
+            'rows_out': rows_out,
+        })
+        return result
+
+    @classmethod
+    def summary(cls) -> pd.DataFrame:
+        columns = ['stage', 'calls', 'wall_seconds', 'cpu_seconds', 'peak_memory_bytes', 'rows_in', 'rows_out']
+        if not cls.records:
+            return pd.DataFrame(columns=columns)
+
+        records = pd.DataFrame(cls.records)
+        summary = records.groupby('stage', sort=False).agg(
+            calls=('stage', 'size'),
+            wall_seconds=('wall_seconds', 'sum'),
+            cpu_seconds=('cpu_seconds', 'sum'),
+            peak_memory_bytes=('peak_memory_bytes', 'max'),
+            rows_in=('rows_in', lambda rows: rows.sum(min_count=1)),
+            rows_out=('rows_out', lambda rows: rows.sum(min_count=1)),
+        ).reset_index()
+        return summary.sort_values('wall_seconds', ascending=False, ignore_index=True)[columns]
+
+    @classmethod
+    def write_report(cls, output_path: Path):
+        summary = cls.summary()
+        report = {'records': cls.records, 'summary': json.loads(summary.to_json(orient='records'))}
+        Path(output_path).write_text(json.dumps(report, indent=2))
+        return summary
+
+
+def profiled(func):
+    stage = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not Profiler.enabled:
+            return func(*args, **kwargs)
+        return Profiler.call(stage, func, args, kwargs)
+
+    return wrapper
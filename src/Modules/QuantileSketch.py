@@ -0,0 +1,124 @@
+import math
+import numpy as np
+import pandas as pd
+from typing import Optional
+
+
+class GroupedQuantileSketch:
+    """Mergeable per-group summary of a numeric column: count and sum per value bucket.
+
+    With ``relative_accuracy=None`` every distinct value is its own bucket, so
+    quantiles and trimmed means are exact and the size grows with the number of
+    distinct values. With a float accuracy ``a`` values fall into logarithmic
+    buckets (as in DDSketch): every quantile is within a relative error of ``a``
+    and the size is bounded by the value range, not the row count.
+    """
+
+    MIN_MAGNITUDE = 1e-9
+    COLUMNS = ['group', 'bucket', 'count', 'sum']
+
+    def __init__(self, relative_accuracy: Optional[float] = None, buckets: Optional[pd.DataFrame] = None):
+        if relative_accuracy is not None and not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy must be in (0, 1), got {relative_accuracy}")
+
+        self.relative_accuracy = relative_accuracy
+        if relative_accuracy is not None:
+            self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+            self.log_gamma = math.log(self.gamma)
+            self.offset = 1 - math.ceil(math.log(self.MIN_MAGNITUDE) / self.log_gamma)
+
+        if buckets is None:
+            buckets = pd.DataFrame(columns=self.COLUMNS).astype({'count': 'int64', 'sum': 'float64'})
+        self.buckets = buckets[self.COLUMNS]
+
+    def _bucket_keys(self, values: np.ndarray) -> np.ndarray:
+        if self.relative_accuracy is None:
+            return values
+
+        keys = np.zeros(len(values), dtype=np.int64)
+        positive = values > self.MIN_MAGNITUDE
+        negative = values < -self.MIN_MAGNITUDE
+        keys[positive] = np.ceil(np.log(values[positive]) / self.log_gamma).astype(np.int64) + self.offset
+        keys[negative] = -(np.ceil(np.log(-values[negative]) / self.log_gamma).astype(np.int64) + self.offset)
+        return keys
+
+    def _bucket_values(self, keys: np.ndarray) -> np.ndarray:
+        if self.relative_accuracy is None:
+            return keys.astype(float)
+
+        exponents = np.abs(keys) - self.offset
+        magnitudes = 2 * np.power(self.gamma, exponents.astype(float)) / (self.gamma + 1)
+        return np.where(keys == 0, 0.0, np.sign(keys) * magnitudes)
+
+    def update(self, groups: pd.Series, values: pd.Series):
+        valid = values.notna().to_numpy() & groups.notna().to_numpy()
+        numbers = values.to_numpy(dtype=float)[valid]
+        chunk = pd.DataFrame({
+            'group': groups.to_numpy()[valid],
+            'bucket': self._bucket_keys(numbers),
+            'value': numbers,
+        })
+        partial = chunk.groupby(['group', 'bucket'], observed=True, sort=False)['value'].agg(['count', 'sum']).reset_index()
+        return self.merge_buckets(partial)
+
+    def merge_buckets(self, buckets: pd.DataFrame):
+        if buckets.empty:
+            return self
+        if self.buckets.empty:
+            self.buckets = buckets[self.COLUMNS].reset_index(drop=True)
+            return self
+
+        combined = pd.concat([self.buckets, buckets[self.COLUMNS]], ignore_index=True)
+        self.buckets = combined.groupby(['group', 'bucket'], observed=True, sort=False)[['count', 'sum']].sum().reset_index()
+        return self
+
+    def merge(self, other: 'GroupedQuantileSketch'):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracies")
+        return self.merge_buckets(other.buckets)
+
+    def counts(self) -> pd.Series:
+        return self.buckets.groupby('group', observed=True)['count'].sum()
+
+    def sums(self) -> pd.Series:
+        return self.buckets.groupby('group', observed=True)['sum'].sum()
+
+    def _sorted_groups(self):
+        ordered = self.buckets.sort_values(['group', 'bucket'], kind='stable')
+        for group, group_buckets in ordered.groupby('group', observed=True, sort=True):
+            yield group, self._bucket_values(group_buckets['bucket'].to_numpy()), group_buckets['count'].to_numpy(), \
+                group_buckets['sum'].to_numpy()
+
+    def quantiles(self, qs: list[float]) -> pd.DataFrame:
+        # Linear interpolation between order statistics, as pandas does by default.
+        rows = {}
+        for group, bucket_values, counts, _ in self._sorted_groups():
+            total = counts.sum()
+            cumulative = np.cumsum(counts)
+            positions = np.asarray(qs, dtype=float) * (total - 1)
+            lower = bucket_values[np.searchsorted(cumulative, np.floor(positions), side='right')]
+            upper = bucket_values[np.searchsorted(cumulative, np.ceil(positions), side='right')]
+            rows[group] = lower + (upper - lower) * (positions - np.floor(positions))
+
+        return pd.DataFrame.from_dict(rows, orient='index', columns=list(qs))
+
+    def trimmed_means(self, lower_bounds: pd.Series, upper_bounds: pd.Series) -> pd.Series:
+        # Exact value sums of the buckets inside [lower, upper]; groups with nothing inside are dropped.
+        means = {}
+        for group, bucket_values, counts, sums in self._sorted_groups():
+            if group not in lower_bounds.index:
+                continue
+            inside = (bucket_values >= lower_bounds[group]) & (bucket_values <= upper_bounds[group])
+            if counts[inside].sum():
+                means[group] = sums[inside].sum() / counts[inside].sum()
+        return pd.Series(means, dtype=float)
+
+    def robust_means(self, min_sample_size: int = 30) -> pd.Series:
+        counts = self.counts()
+        significant_groups = counts[counts >= min_sample_size].index
+        if significant_groups.empty:
+            return pd.Series(dtype=float)
+
+        quartiles = self.quantiles([0.25, 0.75]).loc[significant_groups]
+        IQR = quartiles[0.75] - quartiles[0.25]
+        return self.trimmed_means(quartiles[0.25] - 1.5 * IQR, quartiles[0.75] + 1.5 * IQR)
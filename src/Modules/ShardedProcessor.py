@@ -0,0 +1,268 @@
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Optional, Union
+from Modules.DataLoader import DataLoader
+from Modules.DataProcessor import DataProcessor, broadcast_group_values, fence_mask, min_max_scale, sketch_group_fences
+from Modules.ExecutionPlan import FILTER_STEPS, ROW_LOCAL_STEPS, PlanStep, as_list
+from Modules.QuantileSketch import GroupedQuantileSketch
+
+# Row ids are file_index * ROW_ID_STRIDE + row position in the raw file, so rows sort back into input order.
+ROW_ID_STRIDE = 1 << 40
+
+# Steps that need statistics over every shard; each one adds a map/reduce round before the final pass.
+STATEFUL_STEPS = ('impute_by_group_mean', 'remove_outliers_by_group', 'normalize_column')
+# Steps that only make sense on the combined frame; they run after the reduce.
+FINAL_STEPS = ('compact_dtypes',)
+
+
+# --- Partial statistics (map) and their merge (reduce), per stateful step ---
+
+def _impute_partial(df: pd.DataFrame, target_col: Union[str, list[str]], group_by_col: str) -> pd.DataFrame:
+    target_cols = as_list(target_col)
+    grouped = df[target_cols].groupby(df[group_by_col], dropna=False, observed=True)
+    counts = grouped.count()
+    return pd.concat({'sum': grouped.sum(), 'count': counts, 'nulls': counts.rsub(grouped.size(), axis=0)}, axis=1)
+
+
+def _impute_state(partials: list[pd.DataFrame], target_col: Union[str, list[str]], group_by_col: str) -> tuple:
+    totals = pd.concat(partials).groupby(level=0, dropna=False).sum()
+    group_means = totals['sum'] / totals['count']
+    known = group_means[group_means.index.notna()]
+    # The overall mean is taken after the group fill, so filled nulls count at their group mean.
+    filled_nulls = totals['nulls'].loc[known.index].where(known.notna(), 0)
+    overall = (totals['sum'].sum() + (filled_nulls * known.fillna(0)).sum()) / (totals['count'].sum() + filled_nulls.sum())
+    return known, overall
+
+
+def _outlier_partial(df: pd.DataFrame, data_col: Union[str, list[str]], group_by_col: str,
+                     relative_accuracy: Optional[float] = None) -> dict[str, GroupedQuantileSketch]:
+    # Without a relative accuracy the sketches keep every distinct value, so the quartiles are exact.
+    return {col: GroupedQuantileSketch(relative_accuracy).update(df[group_by_col], df[col]) for col in as_list(data_col)}
+
+
+def _outlier_state(partials: list[dict[str, GroupedQuantileSketch]], data_col: Union[str, list[str]], group_by_col: str,
+                   relative_accuracy: Optional[float] = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    sketches = partials[0]
+    for partial in partials[1:]:
+        for col, sketch in partial.items():
+            sketches[col].merge(sketch)
+    return sketch_group_fences(sketches)
+
+
+def _range_partial(df: pd.DataFrame, column: str) -> tuple[float, float]:
+    return df[column].min(), df[column].max()
+
+
+def _range_state(partials: list[tuple[float, float]], column: str) -> tuple[float, float]:
+    return np.nanmin([partial[0] for partial in partials]), np.nanmax([partial[1] for partial in partials])
+
+
+def _aggregation_partial(df: pd.DataFrame, group_by_cols: list[str], agg_col: str) -> dict[str, GroupedQuantileSketch]:
+    return {group_by_col: GroupedQuantileSketch().update(df[group_by_col], df[agg_col]) for group_by_col in group_by_cols}
+
+
+PARTIALS = {
+    'impute_by_group_mean': _impute_partial,
+    'remove_outliers_by_group': _outlier_partial,
+    'normalize_column': _range_partial,
+}
+REDUCERS = {
+    'impute_by_group_mean': _impute_state,
+    'remove_outliers_by_group': _outlier_state,
+    'normalize_column': _range_state,
+}
+
+
+def _apply_stateful(processor: DataProcessor, step: PlanStep, state: Any):
+    params = step.params
+    if step.name == 'impute_by_group_mean':
+        target_cols = as_list(params['target_col'])
+        group_means, overall = state
+        fill = broadcast_group_values(group_means, processor.df[params['group_by_col']], target_cols)
+        filled = processor.df[target_cols].fillna(pd.DataFrame(fill, columns=target_cols, index=processor.df.index))
+        processor.df[target_cols] = filled.fillna(overall)
+    elif step.name == 'remove_outliers_by_group':
+        mask = fence_mask(processor.df, as_list(params['data_col']), params['group_by_col'], *state)
+        processor.df = processor._take_rows(pd.Series(mask, index=processor.df.index))
+    else:
+        processor.df[params['column']] = min_max_scale(processor.df[params['column']], *state)
+
+
+# --- Worker tasks; module-level so the process pool can pickle them ---
+
+def _scatter(loader: DataLoader, file_name: str, file_index: int, read_options: dict, parse_options: dict,
+             steps: list[PlanStep], partition_by: Optional[str], partitions: int, spill_folder: Path) -> list[tuple[int, Path]]:
+    try:
+        return _scatter_file(loader, file_name, file_index, {**read_options, **parse_options}, steps,
+                             partition_by, partitions, spill_folder)
+    except (ValueError, TypeError) as e:
+        if not parse_options:
+            raise
+        print(f"--> WARNING: '{file_name}' does not match its schema ({e}); reading it with inferred types.")
+        for stale_piece in spill_folder.glob(f'{file_index}-*.parquet'):
+            stale_piece.unlink()
+        return _scatter_file(loader, file_name, file_index, read_options, steps, partition_by, partitions, spill_folder)
+
+
+def _scatter_file(loader: DataLoader, file_name: str, file_index: int, read_options: dict, steps: list[PlanStep],
+                  partition_by: Optional[str], partitions: int, spill_folder: Path) -> list[tuple[int, Path]]:
+    # Reads one raw file, applies the leading row-local steps and spills each partition's rows to Parquet.
+    pieces = []
+    position = file_index * ROW_ID_STRIDE
+    for chunk_number, chunk in enumerate(loader.iter_csv(file_name, **read_options)):
+        chunk.index = pd.RangeIndex(position, position + len(chunk))
+        position += len(chunk)
+
+        processor = DataProcessor(chunk, copy=False)
+        for step in steps:
+            getattr(processor, step.name)(**step.params)
+        df = processor.df
+
+        if partition_by is None:
+            assignments = np.zeros(len(df), dtype=np.int64)
+        else:
+            assignments = pd.util.hash_pandas_object(df[partition_by], index=False).to_numpy() % partitions
+        for partition in np.unique(assignments):
+            piece_path = spill_folder / f'{file_index}-{chunk_number}-{partition}.parquet'
+            df[assignments == partition].to_parquet(piece_path, index=True)
+            pieces.append((int(partition), piece_path))
+    return pieces
+
+
+def _map_shard(piece_paths: list[Path], steps: list[PlanStep], states: dict[int, Any], partial: Optional[PlanStep]):
+    # Replays the steps on one shard with the states resolved so far, then returns the shard or its partial statistics.
+    processor = DataProcessor(pd.concat([pd.read_parquet(path) for path in piece_paths]), copy=False)
+    for position, step in enumerate(steps):
+        if step.name in STATEFUL_STEPS:
+            _apply_stateful(processor, step, states[position])
+        else:
+            getattr(processor, step.name)(**step.params)
+
+    if partial is None:
+        return processor.df
+    if partial.name == 'get_robust_group_aggregations':
+        return _aggregation_partial(processor.df, **partial.params)
+    return PARTIALS[partial.name](processor.df, **partial.params)
+
+
+class ShardedProcessor:
+    """Runs a DataProcessor plan over several raw files on a process pool, as map/reduce rounds.
+
+    The input is split into shards: one per file, or with ``partition_by`` one
+    per hash bucket of that column across all files. A first map reads each file
+    once, applies the row-local steps that come before the first group-wise step
+    and spills every shard to Parquet. Each group-wise step (group-mean
+    imputation, IQR outlier removal, min-max scaling) is then one round: every
+    shard computes partial statistics (sums and counts, exact quantile sketches,
+    minima and maxima), the parent merges them into the step's state, and later
+    rounds replay the step from that state. A final map applies the whole plan
+    and the reduce concatenates the shards in input order before steps such as
+    ``compact_dtypes`` that need the combined frame. The result matches running
+    the same plan on the concatenated files in one process, up to float
+    summation order.
+
+    ``steps`` is the plan recorded by a lazy DataProcessor, e.g.
+    ``DataProcessor(pd.DataFrame(), lazy=True).filter_rows(...).plan``.
+    """
+
+    def __init__(self, loader: DataLoader, file_names: list[str], steps: list[PlanStep], delimiter: str = ',',
+                 usecols: Optional[list[str]] = None, chunk_size: int = 100_000, parse_options: Optional[dict] = None,
+                 partition_by: Optional[str] = None,
+                 partitions: int = 1, workers: Optional[int] = None, spill_folder: Optional[Path] = None):
+        supported = ROW_LOCAL_STEPS + FILTER_STEPS + STATEFUL_STEPS + FINAL_STEPS
+        unsupported = [step.name for step in steps if step.name not in supported]
+        if unsupported:
+            raise ValueError(f"Steps not supported by ShardedProcessor: {unsupported}")
+        final_start = next((position for position, step in enumerate(steps) if step.name in FINAL_STEPS), len(steps))
+        if any(step.name not in FINAL_STEPS for step in steps[final_start:]):
+            raise ValueError(f"{list(FINAL_STEPS)} must come after every other step")
+        if partition_by is None and partitions != 1:
+            raise ValueError("partitions requires partition_by")
+
+        self.loader = loader
+        self.file_names = list(file_names)
+        self.steps = list(steps[:final_start])
+        self.final_steps = list(steps[final_start:])
+        self.read_options = {'delimiter': delimiter, 'usecols': usecols, 'chunk_size': chunk_size}
+        # Parse-time schema from DataValidator.parse_options; a file that does not match it is read untyped.
+        self.parse_options = parse_options or {}
+        self.partition_by = partition_by
+        self.partitions = partitions
+        self.workers = workers
+        self.spill_folder = spill_folder
+        self.leading_steps = next((position for position, step in enumerate(self.steps) if step.name in STATEFUL_STEPS), len(self.steps))
+
+    def _map(self, executor: Optional[ProcessPoolExecutor], func, *iterables) -> list:
+        return list(executor.map(func, *iterables) if executor is not None else map(func, *iterables))
+
+    def _shards(self, executor: Optional[ProcessPoolExecutor], spill_folder: Path) -> list[list[Path]]:
+        file_count = len(self.file_names)
+        scattered = self._map(
+            executor, _scatter, [self.loader] * file_count, self.file_names, range(file_count),
+            [self.read_options] * file_count, [self.parse_options] * file_count, [self.steps[:self.leading_steps]] * file_count,
+            [self.partition_by] * file_count, [self.partitions] * file_count, [spill_folder] * file_count,
+        )
+        shards: dict[int, list[Path]] = {}
+        for pieces in scattered:
+            for partition, piece_path in pieces:
+                shards.setdefault(partition, []).append(piece_path)
+        return [shards[partition] for partition in sorted(shards)]
+
+    def _run(self, partial: Optional[PlanStep]) -> list:
+        # One scatter, one round per group-wise step, then the final map; returns the final map's outputs.
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers != 1 else None
+        try:
+            with tempfile.TemporaryDirectory(dir=self.spill_folder) as spill_folder:
+                shards = self._shards(executor, Path(spill_folder))
+                if not shards:
+                    return []
+
+                steps = self.steps[self.leading_steps:]
+                states: dict[int, Any] = {}
+                for position, step in enumerate(steps):
+                    if step.name not in STATEFUL_STEPS:
+                        continue
+                    partials = self._map(executor, _map_shard, shards, [steps[:position]] * len(shards),
+                                         [states] * len(shards), [step] * len(shards))
+                    states[position] = REDUCERS[step.name](partials, **step.params)
+
+                return self._map(executor, _map_shard, shards, [steps] * len(shards),
+                                 [states] * len(shards), [partial] * len(shards))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def build(self) -> pd.DataFrame:
+        frames = [frame for frame in self._run(None) if not frame.empty]
+        if not frames:
+            return pd.DataFrame()
+
+        processor = DataProcessor(pd.concat(frames).sort_index().reset_index(drop=True), copy=False)
+        for step in self.final_steps:
+            getattr(processor, step.name)(**step.params)
+        return processor.build()
+
+    def get_robust_group_aggregations(self, group_by_cols: list[str], agg_col: str,
+                                      min_sample_size: int = 30) -> dict[str, pd.DataFrame]:
+        """Robust per-group means of the processed rows, merged from exact per-shard sketches."""
+        partial = PlanStep('get_robust_group_aggregations', {'group_by_cols': list(group_by_cols), 'agg_col': agg_col})
+        partials = self._run(partial)
+
+        results = {}
+        for group_by_col in group_by_cols:
+            sketch = GroupedQuantileSketch()
+            for shard_sketches in partials:
+                sketch.merge(shard_sketches[group_by_col])
+            means = sketch.robust_means(min_sample_size)
+            if means.empty:
+                print(f"--> WARNING: No groups in '{group_by_col}' met the minimum sample size of {min_sample_size}. The resulting aggregation will be empty.")
+                results[group_by_col] = pd.DataFrame(columns=[group_by_col, agg_col])
+                continue
+            results[group_by_col] = means.rename_axis(group_by_col).rename(agg_col).reset_index()
+        return results
+
+    def get_robust_group_aggregation(self, group_by_col: str, agg_col: str, min_sample_size: int = 30) -> pd.DataFrame:
+        return self.get_robust_group_aggregations([group_by_col], agg_col, min_sample_size)[group_by_col]
@@ -0,0 +1,170 @@
+import hashlib
+import inspect
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Optional[Callable[[], None]] = None
+    inputs: list[Path] = field(default_factory=list)
+    outputs: list[Path] = field(default_factory=list)
+    params: Any = None
+    code: list[Any] = field(default_factory=list)
+    deps: list[str] = field(default_factory=list)
+    # Stale stages sharing a batch runner are executed together; it returns the names that failed.
+    batch: Optional[Callable[[list['Stage']], list[str]]] = None
+    payload: Any = None
+
+
+class StageGraph:
+    """Runs pipeline stages in declaration order, skipping those whose key is unchanged.
+
+    A stage's key combines the content hash of its input files, its parameters
+    and the source code of the functions, classes or modules it lists. Keys of
+    the last successful run are kept in a JSON state file.
+    """
+
+    def __init__(self, state_file: Path):
+        self.state_file = Path(state_file)
+        self.stages: dict[str, Stage] = {}
+        self.state = json.loads(self.state_file.read_text()) if self.state_file.exists() else {}
+        self.state.setdefault('stages', {})
+        self.state.setdefault('files', {})
+
+    def add(self, stage: Stage) -> Stage:
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        missing_deps = [dep for dep in stage.deps if dep not in self.stages]
+        if missing_deps:
+            raise ValueError(f"Stage '{stage.name}' depends on undeclared stages: {missing_deps}")
+        self.stages[stage.name] = stage
+        return stage
+
+    @staticmethod
+    def _digest(payload: Any) -> str:
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=repr).encode()).hexdigest()
+
+    def _file_hash(self, path: Path) -> Optional[str]:
+        # Content hashes are memoized by size and mtime, so unchanged files are not re-read.
+        path = Path(path)
+        if not path.exists():
+            return None
+        stat = path.stat()
+        cached = self.state['files'].get(str(path))
+        if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+            return cached['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+        self.state['files'][str(path)] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def _key(self, stage: Stage) -> dict:
+        return {
+            'inputs': {str(path): self._file_hash(path) for path in stage.inputs},
+            'params': self._digest(stage.params),
+            'code': self._digest([inspect.getsource(obj) for obj in stage.code]),
+        }
+
+    def _reasons(self, stage: Stage, rebuilding: set[str]) -> list[str]:
+        reasons = [f"upstream '{dep}' rebuilds" for dep in stage.deps if dep in rebuilding]
+        previous = self.state['stages'].get(stage.name)
+        if previous is None:
+            return reasons + ['never built']
+
+        key = self._key(stage)
+        missing_outputs = [str(path) for path in stage.outputs if not Path(path).exists()]
+        if missing_outputs:
+            reasons.append(f"missing outputs: {missing_outputs}")
+        changed_inputs = sorted(path for path in set(key['inputs']) | set(previous['inputs'])
+                                if key['inputs'].get(path) != previous['inputs'].get(path))
+        if changed_inputs:
+            reasons.append(f"inputs changed: {changed_inputs}")
+        if key['params'] != previous['params']:
+            reasons.append('parameters changed')
+        if key['code'] != previous['code']:
+            reasons.append('code changed')
+        return reasons
+
+    def _selected(self, targets: Optional[list[str]]) -> list[Stage]:
+        # The target stages and everything they depend on, in declaration order.
+        if targets is None:
+            return list(self.stages.values())
+
+        needed, pending = set(), list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in needed:
+                needed.add(name)
+                pending.extend(self.stages[name].deps)
+        return [stage for stage in self.stages.values() if stage.name in needed]
+
+    def plan(self, targets: Optional[list[str]] = None) -> dict[str, list[str]]:
+        # Stages that would rebuild, with the reasons; downstream stages of a rebuild are assumed stale.
+        stale = {}
+        for stage in self._selected(targets):
+            reasons = self._reasons(stage, set(stale))
+            if reasons:
+                stale[stage.name] = reasons
+        return stale
+
+    def explain(self, targets: Optional[list[str]] = None) -> str:
+        stale = self.plan(targets)
+        selected = self._selected(targets)
+        lines = [f"== {len(stale)} of {len(selected)} stages would rebuild =="]
+        for stage in selected:
+            lines.append(f"  {'rebuild' if stage.name in stale else 'fresh  '} {stage.name}")
+            lines.extend(f"      - {reason}" for reason in stale.get(stage.name, []))
+        return '\n'.join(lines)
+
+    def _record(self, stage: Stage):
+        self.state['stages'][stage.name] = self._key(stage)
+
+    def _save(self):
+        self.state['stages'] = {name: key for name, key in self.state['stages'].items() if name in self.stages}
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        self.state_file.write_text(json.dumps(self.state, indent=2, sort_keys=True))
+
+    def run(self, targets: Optional[list[str]] = None) -> list[str]:
+        """Executes stale stages and returns the names of the ones that ran.
+
+        With ``targets`` only those stages and their dependencies are considered.
+
+        Staleness is checked right before each stage, so a downstream stage whose
+        rebuilt inputs came out identical is still skipped. A failing stage
+        stops the run; the keys of the stages that finished are saved first.
+        """
+        selected = self._selected(targets)
+        executed, done = [], set()
+        try:
+            for stage in selected:
+                if stage.name in done:
+                    continue
+                if not self._reasons(stage, set()):
+                    done.add(stage.name)
+                    continue
+
+                if stage.batch is None:
+                    stage.run()
+                    self._record(stage)
+                    executed.append(stage.name)
+                    done.add(stage.name)
+                    continue
+
+                group = [other for other in selected if other.batch == stage.batch and other.name not in done
+                         and all(dep in done for dep in other.deps) and self._reasons(other, set())]
+                failed = set(stage.batch(group))
+                for other in group:
+                    done.add(other.name)
+                    if other.name not in failed:
+                        self._record(other)
+                        executed.append(other.name)
+        finally:
+            self._save()
+        return executed
@@ -1,117 +1,299 @@
-import shutil
+import argparse
+import asyncio
+import inspect
+import os
+import pandas as pd
+from functools import partial
 from pathlib import Path
+from Modules.AggregateStore import AggregateStore
+from Modules.AnalysisService import AnalysisService
+from Modules.CorrelationAccumulator import CorrelationAccumulator
 from Modules.GraphGenerator import GraphGenerator
 from Modules.DataLoader import DataLoader
-from Modules.DataProcessor import DataProcessor
+from Modules.DataProcessor import ChunkedDataProcessor, DataProcessor
+from Modules.DataValidator import DataValidator
+from Modules.DtypeCompactor import DtypeCompactor
+from Modules.ExecutionPlan import PlanStep
+from Modules.Plotter import PlotterFactory
+from Modules.PlotStatistics import GroupSummaryCache
+from Modules.Profiler import Profiler
+from Modules.QuantileSketch import GroupedQuantileSketch
+from Modules.ShardedProcessor import ShardedProcessor
+from Modules.StageGraph import Stage, StageGraph
+
+
+RENAME_DICT = {
+    'NU_ANO': 'ANO_ENADE', 'CO_IES': 'CODIGO_IES', 'CO_CATEGAD': 'CODIGO_CATEGORIA_ADMINISTRATIVA',
+    'CO_ORGACAD': 'CODIGO_ORGANIZACAO_ACADEMICA', 'CO_GRUPO': 'CODIGO_AREA_AVALIACAO',
+    'CO_CURSO': 'CODIGO_CURSO', 'CO_MODALIDADE': 'CODIGO_MODALIDADE_ENSINO',
+    'CO_MUNIC_CURSO': 'CODIGO_MUNICIPIO_CURSO', 'TP_INSCRICAO': 'TIPO_INSCRICAO_ENADE',
+    'IN_REGULAR': 'INDICADOR_SITUACAO_REGULAR', 'TP_INSCRICAO_ADM': 'TIPO_INSCRICAO_ADMINISTRATIVA',
+    'ANO_IN_GRAD': 'ANO_INICIO_GRADUACAO', 'TP_PRES': 'TIPO_PRESENCA_PROVA', 'NT_GER': 'NOTA_GERAL_ENADE',
+    'ANO_ENEM': 'ANO_REALIZACAO_ENEM', 'ENEM_NT_CN': 'NOTA_ENEM_CIENCIAS_NATUREZA',
+    'ENEM_NT_CH': 'NOTA_ENEM_CIENCIAS_HUMANAS', 'ENEM_NT_LC': 'NOTA_ENEM_LINGUAGENS_CODIGOS',
+    'ENEM_NT_MT': 'NOTA_ENEM_MATEMATICA'
+}
+
+
+# Parse-time schema of the raw columns; codes and years fit in int32, so the parser never infers int64.
+# ANO_ENEM is left to inference: it is blank for students without a linked ENEM record.
+RAW_DATA_TYPES = {
+    'NU_ANO': 'int32', 'CO_IES': 'int32', 'CO_CATEGAD': 'int32', 'CO_ORGACAD': 'int32', 'CO_GRUPO': 'int32',
+    'CO_CURSO': 'int32', 'CO_MODALIDADE': 'int32', 'CO_MUNIC_CURSO': 'int32', 'TP_INSCRICAO': 'int32',
+    'IN_REGULAR': 'int32', 'TP_INSCRICAO_ADM': 'int32', 'ANO_IN_GRAD': 'int32', 'TP_PRES': 'int32',
+    'NT_GER': 'float64', 'ENEM_NT_CN': 'float64', 'ENEM_NT_CH': 'float64',
+    'ENEM_NT_LC': 'float64', 'ENEM_NT_MT': 'float64'
+}
+
+
+COLUMN_MAPS = {
+    'CODIGO_CATEGORIA_ADMINISTRATIVA': {
+        1: 'Pública Federal', 2: 'Pública Estadual', 3: 'Pública Municipal',
+        4: 'Privada com fins lucrativos', 5: 'Privada sem fins lucrativos', 7: 'Especial'
+    },
+
+    'CODIGO_ORGANIZACAO_ACADEMICA': {
+        10019: 'Centro Federal de Educação Tecnológica', 10020: 'Centro Universitário',
+        10022: 'Faculdade', 10026: 'Inst. Federal de Educação, Ciência e Tec.', 10028: 'Universidade'
+    },
+
+    'CODIGO_AREA_AVALIACAO': {
+        26: 'Design', 72: 'Tec. ADS', 79: 'Tec. Redes', 702: 'Matemática (Lic)', 904: 'Letras-Português',
+        905: 'Letras-Port./Inglês', 906: 'Letras-Port./Espanhol', 1402: 'Física (Lic)',
+        1602: 'Biologia (Lic)', 2001: 'Ed. Física (Lic)', 2202: 'Pedagogia', 2401: 'História (Bach)',
+        2402: 'História (Lic)', 2501: 'Artes Visuais (Lic)', 3001: 'Geografia (Bach)', 3002: 'Geografia (Lic)',
+        3201: 'Filosofia (Bach)', 3202: 'Filosofia (Lic)', 3502: 'Química (Lic)', 4003: 'Sistemas de Informação',
+        4301: 'Música (Lic)', 5401: 'Ciências Sociais (Bach)', 5402: 'Ciências Sociais (Lic)',
+        6407: 'Letras-Inglês', 6409: 'Tec. Gestão de TI'
+    },
+
+    'CODIGO_MODALIDADE_ENSINO': {0: 'EaD', 1: 'Presencial'},
+}
+
+
+ENEM_GRADE_COLS = ['NOTA_ENEM_CIENCIAS_NATUREZA', 'NOTA_ENEM_CIENCIAS_HUMANAS', 'NOTA_ENEM_LINGUAGENS_CODIGOS', 'NOTA_ENEM_MATEMATICA']
+
+
+def clean_data(processor: DataProcessor) -> DataProcessor:
+    return processor.impute_by_group_mean(ENEM_GRADE_COLS, 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
+       .remove_outliers_by_group(['NOTA_ENEM_MATEMATICA', 'NOTA_GERAL_ENADE'], 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
+       .normalize_column('NOTA_GERAL_ENADE') \
+       .convert_type('ANO_INICIO_GRADUACAO', 'int') \
+       .map_columns(COLUMN_MAPS) \
+       .add_duration_column('DURATION_GRADUATION', 'ANO_INICIO_GRADUACAO', 'ANO_ENADE') \
+       .compact_dtypes(downcast_floats=False)
 
 
-def clear_directory(directory_path: Path):
-    if directory_path.exists():
-        for item in directory_path.iterdir():
-            if item.is_dir():
-                shutil.rmtree(item)
-            else:
-                item.unlink()
+def process_raw_data(loader: DataLoader, raw_data_file: str, chunk_size: int, copy: bool = True) -> DataProcessor:
+    # Row-local steps run chunk by chunk, reading only the columns we keep, typed by the parser.
+    def filter_raw_data(parse_options: dict) -> pd.DataFrame:
+        raw_chunks = partial(loader.iter_csv, raw_data_file, delimiter=';', chunk_size=chunk_size,
+                             usecols=list(RENAME_DICT), **parse_options)
+        return ChunkedDataProcessor(raw_chunks) \
+           .filter_rows('NT_GER', '>', 0) \
+           .rename_columns(RENAME_DICT) \
+           .build()
+
+    try:
+        filtered_df = filter_raw_data(DataValidator.parse_options(RAW_DATA_TYPES))
+    except (ValueError, TypeError) as e:
+        print(f"--> WARNING: '{raw_data_file}' does not match RAW_DATA_TYPES ({e}); reading it with inferred types.")
+        filtered_df = filter_raw_data({})
+
+    return clean_data(DataProcessor(filtered_df, lazy=True, copy=copy))
+
+
+def process_raw_data_sharded(loader: DataLoader, raw_data_files: list[str], chunk_size: int, workers: int,
+                             partition_by: str) -> ShardedProcessor:
+    # The same steps as process_raw_data, recorded as a plan and run as map/reduce rounds over hash partitions.
+    plan = DataProcessor(pd.DataFrame(), lazy=True) \
+       .filter_rows('NT_GER', '>', 0) \
+       .rename_columns(RENAME_DICT)
+    return ShardedProcessor(loader, raw_data_files, clean_data(plan).plan, delimiter=';', usecols=list(RENAME_DICT),
+                            chunk_size=chunk_size, parse_options=DataValidator.parse_options(RAW_DATA_TYPES),
+                            partition_by=partition_by, partitions=workers, workers=workers)
+
+
+def source_modules(*objects) -> list:
+    # Stage code versions cover the whole module a class or function lives in.
+    return [inspect.getmodule(obj) for obj in objects]
 
 
 def main():
+    def add_run_options(parser: argparse.ArgumentParser):
+        parser.add_argument('--dry-run', action='store_true', help='List the stages that would rebuild and why, without running them.')
+        parser.add_argument('--profile', type=Path, metavar='REPORT', help='Record per-stage timings, memory and rows into a JSON report.')
+        parser.add_argument('--profile-stage', metavar='STAGE', help='Also run cProfile around one stage, e.g. DataProcessor.remove_outliers_by_group.')
+        parser.add_argument('--workers', type=int, metavar='N', help='Process each raw file as N hash partitions on N processes (default: one process).')
+
+    parser = argparse.ArgumentParser(description='Process ENADE data, aggregate it and render the charts.')
+    add_run_options(parser)
+    # Options are accepted before or after the command; suppressed defaults keep the subcommand from resetting them.
+    options = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    add_run_options(options)
+    subparsers = parser.add_subparsers(dest='command', metavar='COMMAND', help='Defaults to running every stage.')
+    subparsers.add_parser('process', parents=[options], help='Clean the raw files and update the per-year aggregate state.')
+    subparsers.add_parser('aggregate', parents=[options], help='Write the aggregation tables (processing stale years first).')
+    subparsers.add_parser('plot', parents=[options], help='Render the charts (rebuilding any stale inputs first).')
+    serve_parser = subparsers.add_parser('serve', help="Serve aggregations and charts over HTTP from the latest year's processed frame.")
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8000)
+    serve_parser.add_argument('--cache-mb', type=int, default=256, help='Memory cap of the response cache.')
+    args = parser.parse_args()
+
+    if args.profile:
+        Profiler.enable(profile_stage=args.profile_stage)
+
     # --- Configuration ---
     base_data_folder = Path('data')
     raw_data_folder = base_data_folder / 'raw'
     processed_data_folder = base_data_folder / 'processed'
+    cache_folder = base_data_folder / 'cache'
     output_folder = Path('output')
 
-    # --- Clean up previous runs ---
-    clear_directory(processed_data_folder)
-    clear_directory(output_folder)
+    state_folder = base_data_folder / 'state'
 
+    # Processed files, aggregate state and charts are kept between runs; only stale stages rebuild.
     processed_data_folder.mkdir(parents=True, exist_ok=True)
     output_folder.mkdir(parents=True, exist_ok=True)
 
-    raw_data_file = '2021.txt'
-    processed_data_file = '2021_processed.csv'
-    admin_performance_file = 'admin_category_performance.csv'
-    modality_performance_file = 'modality_performance.csv'
-    area_performance_file = 'area_performance.csv'
-    top_5_areas_file = 'top_5_areas.csv'
-    bottom_5_areas_file = 'bottom_5_areas.csv'
-    performance_by_year_file = 'performance_by_year.csv'
+    # Output tables are named without a suffix; OUTPUT_FORMAT decides the file type.
+    admin_performance_file = 'admin_category_performance'
+    modality_performance_file = 'modality_performance'
+    area_performance_file = 'area_performance'
+    top_5_areas_file = 'top_5_areas'
+    bottom_5_areas_file = 'bottom_5_areas'
+    performance_by_year_file = 'performance_by_year'
     MIN_SAMPLE_SIZE = 30
-
-    # --- Step 1: Processing, Transformation, and Saving ---
-    loader = DataLoader(raw_data_folder)
-    raw_df = loader.load_csv(raw_data_file, delimiter=';')
-
-    processor = DataProcessor(raw_df)
-
-    rename_dict = {
-        'NU_ANO': 'ANO_ENADE', 'CO_IES': 'CODIGO_IES', 'CO_CATEGAD': 'CODIGO_CATEGORIA_ADMINISTRATIVA',
-        'CO_ORGACAD': 'CODIGO_ORGANIZACAO_ACADEMICA', 'CO_GRUPO': 'CODIGO_AREA_AVALIACAO',
-        'CO_CURSO': 'CODIGO_CURSO', 'CO_MODALIDADE': 'CODIGO_MODALIDADE_ENSINO',
-        'CO_MUNIC_CURSO': 'CODIGO_MUNICIPIO_CURSO', 'TP_INSCRICAO': 'TIPO_INSCRICAO_ENADE',
-        'IN_REGULAR': 'INDICADOR_SITUACAO_REGULAR', 'TP_INSCRICAO_ADM': 'TIPO_INSCRICAO_ADMINISTRATIVA',
-        'ANO_IN_GRAD': 'ANO_INICIO_GRADUACAO', 'TP_PRES': 'TIPO_PRESENCA_PROVA', 'NT_GER': 'NOTA_GERAL_ENADE',
-        'ANO_ENEM': 'ANO_REALIZACAO_ENEM', 'ENEM_NT_CN': 'NOTA_ENEM_CIENCIAS_NATUREZA',
-        'ENEM_NT_CH': 'NOTA_ENEM_CIENCIAS_HUMANAS', 'ENEM_NT_LC': 'NOTA_ENEM_LINGUAGENS_CODIGOS',
-        'ENEM_NT_MT': 'NOTA_ENEM_MATEMATICA'
-    }
-
-    column_maps = {
-        'CODIGO_CATEGORIA_ADMINISTRATIVA': {
-            1: 'Pública Federal', 2: 'Pública Estadual', 3: 'Pública Municipal',
-            4: 'Privada com fins lucrativos', 5: 'Privada sem fins lucrativos', 7: 'Especial'
-        },
-
-        'CODIGO_ORGANIZACAO_ACADEMICA': {
-            10019: 'Centro Federal de Educação Tecnológica', 10020: 'Centro Universitário',
-            10022: 'Faculdade', 10026: 'Inst. Federal de Educação, Ciência e Tec.', 10028: 'Universidade'
-        },
-
-        'CODIGO_AREA_AVALIACAO': {
-            26: 'Design', 72: 'Tec. ADS', 79: 'Tec. Redes', 702: 'Matemática (Lic)', 904: 'Letras-Português',
-            905: 'Letras-Port./Inglês', 906: 'Letras-Port./Espanhol', 1402: 'Física (Lic)',
-            1602: 'Biologia (Lic)', 2001: 'Ed. Física (Lic)', 2202: 'Pedagogia', 2401: 'História (Bach)',
-            2402: 'História (Lic)', 2501: 'Artes Visuais (Lic)', 3001: 'Geografia (Bach)', 3002: 'Geografia (Lic)',
-            3201: 'Filosofia (Bach)', 3202: 'Filosofia (Lic)', 3502: 'Química (Lic)', 4003: 'Sistemas de Informação',
-            4301: 'Música (Lic)', 5401: 'Ciências Sociais (Bach)', 5402: 'Ciências Sociais (Lic)',
-            6407: 'Letras-Inglês', 6409: 'Tec. Gestão de TI'
-        },
-
-        'CODIGO_MODALIDADE_ENSINO': {0: 'EaD', 1: 'Presencial'},
+    CHUNK_SIZE = 500_000
+    RENDER_WORKERS = 1 if args.profile else os.cpu_count() or 1  # worker processes are not profiled
+    PROCESS_WORKERS = args.workers or 1
+    PARTITION_COL = 'CODIGO_AREA_AVALIACAO'
+    AGGREGATION_SCOPE = 'cumulative'  # 'cumulative' merges every year, 'per_year' writes one set of tables per year
+    STATE_RELATIVE_ACCURACY = None  # None keeps the per-year state exact; e.g. 0.001 bounds its size but makes the tables approximate
+    GROUP_BY_COLS = ['CODIGO_CATEGORIA_ADMINISTRATIVA', 'CODIGO_MODALIDADE_ENSINO', 'CODIGO_AREA_AVALIACAO', 'ANO_INICIO_GRADUACAO']
+    AGG_COL = 'NOTA_GERAL_ENADE'
+    OUTPUT_FORMAT = '.arrow'  # '.arrow' (memory-mapped, zero-copy reads), '.parquet' (compressed) or '.csv'
+    EXPORT_CSV = True  # also write every table as CSV next to the columnar file
+
+    def table_paths(name: str) -> list[Path]:
+        paths = [processed_data_folder / f'{name}{OUTPUT_FORMAT}']
+        if EXPORT_CSV and OUTPUT_FORMAT != '.csv':
+            paths.append(processed_data_folder / f'{name}.csv')
+        return paths
+
+    def save_table(df: pd.DataFrame, name: str):
+        for path in table_paths(name):
+            if path.suffix == '.csv':
+                df.to_csv(path, index=False)
+            else:
+                DataLoader.write_table(df, path)
+
+    loader = DataLoader(raw_data_folder, cache_folder=cache_folder)
+    store = AggregateStore(state_folder, relative_accuracy=STATE_RELATIVE_ACCURACY)
+    graph = StageGraph(base_data_folder / 'stages.json')
+
+    years = sorted(raw_file.stem for raw_file in raw_data_folder.glob('*.txt'))
+    if not years:
+        raise FileNotFoundError(f"No raw data files found in {raw_data_folder}")
+
+    if args.command == 'serve':
+        service = AnalysisService(
+            source_path=raw_data_folder / f'{years[-1]}.txt',
+            build_frame=lambda: process_raw_data(loader, f'{years[-1]}.txt', CHUNK_SIZE, copy=False).build(),
+            agg_col=AGG_COL,
+            min_sample_size=MIN_SAMPLE_SIZE,
+            cache_max_bytes=args.cache_mb * 1024 ** 2,
+        )
+        asyncio.run(service.serve(args.host, args.port))
+        return
+
+    # --- Step 1: Processing, Transformation, and Saving (one stage per year) ---
+    processed_frames = {}
+
+    def process_year(year: str):
+        if PROCESS_WORKERS > 1:
+            processed_df = process_raw_data_sharded(loader, [f'{year}.txt'], CHUNK_SIZE, PROCESS_WORKERS, PARTITION_COL).build()
+        else:
+            # The filtered frame is private to process_raw_data, so the processor can work on it without copies.
+            processed_df = process_raw_data(loader, f'{year}.txt', CHUNK_SIZE, copy=False).build()
+        save_table(processed_df, f'{year}_processed')
+        processed_frames[year] = processed_df
+
+    def update_state(year: str):
+        processed_df = processed_frames.pop(year, None)
+        if processed_df is None:
+            processed_path = table_paths(f'{year}_processed')[0]
+            processed_df = pd.read_csv(processed_path) if OUTPUT_FORMAT == '.csv' else DataLoader.read_table(processed_path)
+        store.update(year, processed_df, GROUP_BY_COLS, AGG_COL, source_path=raw_data_folder / f'{year}.txt')
+
+    for year in years:
+        graph.add(Stage(
+            name=f'process:{year}',
+            run=partial(process_year, year),
+            inputs=[raw_data_folder / f'{year}.txt'],
+            outputs=table_paths(f'{year}_processed'),
+            params={'rename': RENAME_DICT, 'raw_data_types': RAW_DATA_TYPES, 'column_maps': COLUMN_MAPS, 'output_format': OUTPUT_FORMAT, 'export_csv': EXPORT_CSV},
+            code=[clean_data, process_raw_data, process_raw_data_sharded] + source_modules(
+                DataLoader, DataProcessor, DataValidator, PlanStep, DtypeCompactor, GroupedQuantileSketch, ShardedProcessor),
+        ))
+        graph.add(Stage(
+            name=f'state:{year}',
+            run=partial(update_state, year),
+            inputs=table_paths(f'{year}_processed')[:1],
+            outputs=store.state_files(year, GROUP_BY_COLS, AGG_COL),
+            params={'group_by_cols': GROUP_BY_COLS, 'agg_col': AGG_COL, 'relative_accuracy': store.relative_accuracy},
+            code=source_modules(AggregateStore, GroupedQuantileSketch),
+            deps=[f'process:{year}'],
+        ))
+
+    # --- Step 2: Aggregation for Analysis (merged from the per-year state, one stage per table) ---
+    if AGGREGATION_SCOPE == 'cumulative':
+        scopes = {'': years}
+    else:
+        scopes = {f'{year}_': [year] for year in years}
+
+    aggregation_files = {
+        'CODIGO_CATEGORIA_ADMINISTRATIVA': [admin_performance_file],
+        'CODIGO_MODALIDADE_ENSINO': [modality_performance_file],
+        'CODIGO_AREA_AVALIACAO': [area_performance_file, top_5_areas_file, bottom_5_areas_file],
+        'ANO_INICIO_GRADUACAO': [performance_by_year_file],
     }
 
-    processor.filter_rows('NT_GER', '>', 0) \
-       .rename_columns(rename_dict) \
-       .impute_by_group_mean('NOTA_ENEM_CIENCIAS_NATUREZA', 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
-       .impute_by_group_mean('NOTA_ENEM_CIENCIAS_HUMANAS', 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
-       .impute_by_group_mean('NOTA_ENEM_LINGUAGENS_CODIGOS', 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
-       .impute_by_group_mean('NOTA_ENEM_MATEMATICA', 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
-       .remove_outliers_by_group('NOTA_ENEM_MATEMATICA', 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
-       .remove_outliers_by_group('NOTA_GERAL_ENADE', 'CODIGO_CATEGORIA_ADMINISTRATIVA') \
-       .normalize_column('NOTA_GERAL_ENADE') \
-       .convert_type('ANO_INICIO_GRADUACAO', 'int') \
-       .map_columns(column_maps) \
-       .add_duration_column('DURATION_GRADUATION', 'ANO_INICIO_GRADUACAO', 'ANO_ENADE')
-
-    processed_df = processor.build()
-    processed_df.to_csv(processed_data_folder / processed_data_file, index=False)
-
-    # --- Step 2: Aggregation for Analysis ---
-    admin_performance_df = processor.get_robust_group_aggregation('CODIGO_CATEGORIA_ADMINISTRATIVA', agg_col='NOTA_GERAL_ENADE', min_sample_size=MIN_SAMPLE_SIZE)
-    modality_performance_df = processor.get_robust_group_aggregation('CODIGO_MODALIDADE_ENSINO', agg_col='NOTA_GERAL_ENADE', min_sample_size=MIN_SAMPLE_SIZE)
-    area_performance_df = processor.get_robust_group_aggregation('CODIGO_AREA_AVALIACAO', agg_col='NOTA_GERAL_ENADE', min_sample_size=MIN_SAMPLE_SIZE).sort_values(by='NOTA_GERAL_ENADE', ascending=False)
-    performance_by_year_df = processor.get_robust_group_aggregation('ANO_INICIO_GRADUACAO', agg_col='NOTA_GERAL_ENADE', min_sample_size=MIN_SAMPLE_SIZE)
-
-    admin_performance_df.to_csv(processed_data_folder / admin_performance_file, index=False)
-    modality_performance_df.to_csv(processed_data_folder / modality_performance_file, index=False)
-    area_performance_df.to_csv(processed_data_folder / area_performance_file, index=False)
-    performance_by_year_df.to_csv(processed_data_folder / performance_by_year_file, index=False)
-
-    if not area_performance_df.empty:
-        top_5_areas_df = area_performance_df.head(5)
-        bottom_5_areas_df = area_performance_df.tail(5).sort_values(by='NOTA_GERAL_ENADE', ascending=True)
-        top_5_areas_df.to_csv(processed_data_folder / top_5_areas_file, index=False)
-        bottom_5_areas_df.to_csv(processed_data_folder / bottom_5_areas_file, index=False)
+    def aggregate(prefix: str, scope_years: list[str], group_by_col: str):
+        aggregation_df = store.get_robust_group_aggregation(group_by_col, AGG_COL, min_sample_size=MIN_SAMPLE_SIZE, years=scope_years)
+        if group_by_col != 'CODIGO_AREA_AVALIACAO':
+            save_table(aggregation_df, f'{prefix}{aggregation_files[group_by_col][0]}')
+            return
+
+        area_performance_df = DataProcessor.rank_groups(aggregation_df, AGG_COL, ascending=False)
+        save_table(area_performance_df, f'{prefix}{area_performance_file}')
+        if not area_performance_df.empty:
+            top_5_areas_df = DataProcessor.rank_groups(area_performance_df, AGG_COL, top_k=5)
+            bottom_5_areas_df = DataProcessor.rank_groups(area_performance_df, AGG_COL, ascending=True, top_k=5)
+            save_table(top_5_areas_df, f'{prefix}{top_5_areas_file}')
+            save_table(bottom_5_areas_df, f'{prefix}{bottom_5_areas_file}')
+
+    for prefix, scope_years in scopes.items():
+        for group_by_col, file_names in aggregation_files.items():
+            graph.add(Stage(
+                name=f'aggregate:{prefix}{group_by_col}',
+                run=partial(aggregate, prefix, scope_years, group_by_col),
+                inputs=[path for year in scope_years for path in store.state_files(year, [group_by_col], AGG_COL)],
+                outputs=[path for file_name in file_names for path in table_paths(f'{prefix}{file_name}')],
+                params={'agg_col': AGG_COL, 'min_sample_size': MIN_SAMPLE_SIZE, 'years': scope_years,
+                        'output_format': OUTPUT_FORMAT, 'export_csv': EXPORT_CSV},
+                code=[aggregate] + source_modules(AggregateStore, GroupedQuantileSketch, DataProcessor),
+                deps=[f'state:{year}' for year in scope_years],
+            ))
+
+    # Charts use the latest year's rows and the matching aggregate tables.
+    processed_data_file = f'{years[-1]}_processed{OUTPUT_FORMAT}'
+    chart_prefix = '' if AGGREGATION_SCOPE == 'cumulative' else f'{years[-1]}_'
+    admin_performance_chart_file = chart_prefix + admin_performance_file + OUTPUT_FORMAT
+    top_5_areas_chart_file = chart_prefix + top_5_areas_file + OUTPUT_FORMAT
+    bottom_5_areas_chart_file = chart_prefix + bottom_5_areas_file + OUTPUT_FORMAT
+    performance_by_year_chart_file = chart_prefix + performance_by_year_file + OUTPUT_FORMAT
 
     # --- Step 3: Graph Generation ---
     generator = GraphGenerator(data_folder=processed_data_folder, output_folder=output_folder)
@@ -154,7 +336,7 @@ def main():
         },
 
         {
-            'file_name': admin_performance_file,
+            'file_name': admin_performance_chart_file,
             'plot_type': 'bar',
             'x_col': 'CODIGO_CATEGORIA_ADMINISTRATIVA',
             'y_col': 'NOTA_GERAL_ENADE',
@@ -165,7 +347,7 @@ def main():
         },
 
         {
-            'file_name': top_5_areas_file,
+            'file_name': top_5_areas_chart_file,
             'plot_type': 'bar',
             'x_col': 'CODIGO_AREA_AVALIACAO',
             'y_col': 'NOTA_GERAL_ENADE',
@@ -176,7 +358,7 @@ def main():
         },
 
         {
-            'file_name': bottom_5_areas_file,
+            'file_name': bottom_5_areas_chart_file,
             'plot_type': 'bar',
             'x_col': 'CODIGO_AREA_AVALIACAO',
             'y_col': 'NOTA_GERAL_ENADE',
@@ -187,7 +369,7 @@ def main():
         },
 
         {
-            'file_name': performance_by_year_file,
+            'file_name': performance_by_year_chart_file,
             'plot_type': 'line',
             'x_col': 'ANO_INICIO_GRADUACAO',
             'y_col': 'NOTA_GERAL_ENADE',
@@ -232,11 +414,51 @@ def main():
         }
     ]
 
+    file_stages = {file_name: stage.name for stage in graph.stages.values() for file_name in (path.name for path in stage.outputs)}
+
+    def render(stages: list[Stage]) -> list[str]:
+        failed = generator.generate_many([stage.payload for stage in stages], workers=RENDER_WORKERS)
+        return [f'chart:{output_file_name}' for output_file_name in failed]
+
     for config in graph_configs:
-        try:
-            generator.generate(config)
-        except Exception as e:
-            print(f"Failed to generate graph {config.get('output_file_name', 'N/A')}: {e}")
+        graph.add(Stage(
+            name=f'chart:{config["output_file_name"]}',
+            inputs=[processed_data_folder / config['file_name']],
+            outputs=[output_folder / config['output_file_name']],
+            params=config,
+            code=source_modules(GraphGenerator, PlotterFactory, GroupSummaryCache, CorrelationAccumulator, DataLoader, DataValidator),
+            deps=[file_stages[config['file_name']]],
+            batch=render,
+            payload=config,
+        ))
+
+    # Each command builds its own stages; StageGraph adds whatever they depend on.
+    command_stages = {'process': ('process', 'state'), 'aggregate': ('aggregate',), 'plot': ('chart',)}
+    targets = None
+    if args.command is not None:
+        targets = [name for name in graph.stages if name.split(':')[0] in command_stages[args.command]]
+
+    if args.dry_run:
+        print(graph.explain(targets))
+        return
+
+    graph.run(targets)
+
+    for year in store.years():
+        if year not in years:
+            store.remove(year)
+            for suffix in ('.csv', *DataLoader.TABLE_SUFFIXES):
+                (processed_data_folder / f'{year}_processed{suffix}').unlink(missing_ok=True)
+
+    if args.command in (None, 'plot'):
+        # Charts that are no longer configured are removed.
+        chart_files = {config['output_file_name'] for config in graph_configs}
+        for item in output_folder.iterdir():
+            if item.is_file() and item.name not in chart_files:
+                item.unlink()
+
+    if args.profile:
+        print(Profiler.write_report(args.profile).to_string(index=False))
 
 
 if __name__ == "__main__":
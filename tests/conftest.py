@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules are imported as `Modules.*`, as main.py does from src/.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
@@ -0,0 +1,62 @@
+import math
+import numpy as np
+import pandas as pd
+from Modules.AggregateStore import AggregateStore
+from Modules.DataProcessor import DataProcessor
+
+GROUPS = 5
+LOW, HIGH = 0.05, 1.0
+ACCURACY = 0.001
+
+
+def make_grades(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'group': rng.integers(0, GROUPS, rows),
+        'grade': np.clip(rng.normal(0.5, 0.15, rows), LOW, HIGH),
+    })
+
+
+def stored_buckets(tmp_path, df: pd.DataFrame, relative_accuracy) -> tuple[AggregateStore, int]:
+    source_path = tmp_path / 'source.txt'
+    source_path.write_text('raw')
+    store = AggregateStore(tmp_path / f'state-{len(df)}-{relative_accuracy}', relative_accuracy=relative_accuracy)
+    store.update('2021', df, ['group'], 'grade', source_path=source_path)
+    return store, len(pd.read_parquet(store._state_path('2021', 'group', 'grade')))
+
+
+def test_sketched_state_size_is_bounded_by_the_value_range(tmp_path):
+    gamma = (1 + ACCURACY) / (1 - ACCURACY)
+    buckets_per_group = math.ceil(math.log(HIGH / LOW) / math.log(gamma)) + 1
+
+    for rows in (10_000, 200_000):
+        _, buckets = stored_buckets(tmp_path, make_grades(rows), ACCURACY)
+        assert buckets <= GROUPS * buckets_per_group
+
+    # Exact state keeps one bucket per distinct value, so it grows with the rows.
+    _, exact_buckets = stored_buckets(tmp_path, make_grades(200_000), None)
+    assert exact_buckets > 10 * GROUPS * buckets_per_group
+
+
+def test_sketched_state_robust_means_match_exact(tmp_path):
+    df = make_grades(100_000, seed=1)
+    store, _ = stored_buckets(tmp_path, df, ACCURACY)
+
+    sketched = store.get_robust_group_aggregation('group', 'grade', min_sample_size=30)
+    exact = DataProcessor(df).get_robust_group_aggregation('group', 'grade', min_sample_size=30)
+
+    assert sketched['group'].tolist() == exact['group'].tolist()
+    error = np.abs(sketched['grade'].to_numpy() - exact['grade'].to_numpy()).max()
+    assert error <= ACCURACY * HIGH
+
+
+def test_default_state_matches_exact_aggregation(tmp_path):
+    df = make_grades(50_000, seed=2)
+    source_path = tmp_path / 'source.txt'
+    source_path.write_text('raw')
+    store = AggregateStore(tmp_path / 'state')
+    store.update('2021', df, ['group'], 'grade', source_path=source_path)
+
+    stored = store.get_robust_group_aggregation('group', 'grade', min_sample_size=30)
+    exact = DataProcessor(df).get_robust_group_aggregation('group', 'grade', min_sample_size=30)
+    pd.testing.assert_frame_equal(stored.reset_index(drop=True), exact.reset_index(drop=True), check_dtype=False, rtol=1e-12)
@@ -0,0 +1,111 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from Modules.CorrelationAccumulator import CorrelationAccumulator
+from Modules.DataLoader import DataLoader
+from Modules.GraphGenerator import GraphGenerator, _init_worker
+
+COLUMNS = ['a', 'b', 'c', 'd']
+
+
+def make_frame(rows: int = 20_000, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    base = rng.normal(size=rows)
+    df = pd.DataFrame({
+        'a': 500 + 100 * base,
+        'b': 1e6 + 0.5 * base + rng.normal(size=rows),
+        'c': -3 * base + rng.normal(scale=5, size=rows),
+        'd': rng.gamma(2.0, size=rows),
+    })
+    # Different missing rows per column, so every pair is computed over its own rows.
+    for index, col in enumerate(COLUMNS):
+        df.loc[rng.uniform(size=rows) < 0.05 * (index + 1), col] = np.nan
+    return df
+
+
+def accumulate(chunks) -> CorrelationAccumulator:
+    accumulator = CorrelationAccumulator(COLUMNS)
+    for chunk in chunks:
+        accumulator.update(chunk)
+    return accumulator
+
+
+def split(df: pd.DataFrame, sizes) -> list[pd.DataFrame]:
+    bounds = np.cumsum([0] + list(sizes))
+    return [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def assert_matches(accumulator: CorrelationAccumulator, df: pd.DataFrame):
+    # pandas loses about 1e-11 on 'b' (offset by 1e6); the accumulator itself is checked tightly below.
+    pd.testing.assert_frame_equal(accumulator.corr(), df[COLUMNS].corr(), rtol=0, atol=1e-9)
+
+
+def exact_corr(df: pd.DataFrame) -> pd.DataFrame:
+    # Two-pass Pearson in extended precision over the rows where both columns are present.
+    def pair(x, y):
+        present = ~(np.isnan(x) | np.isnan(y))
+        x = x[present].astype(np.longdouble)
+        y = y[present].astype(np.longdouble)
+        x, y = x - x.mean(), y - y.mean()
+        return float((x * y).sum() / np.sqrt((x * x).sum() * (y * y).sum()))
+    values = [[pair(df[i].to_numpy(), df[j].to_numpy()) for j in COLUMNS] for i in COLUMNS]
+    return pd.DataFrame(values, index=COLUMNS, columns=COLUMNS)
+
+
+@pytest.mark.parametrize('sizes', [[20_000], [1, 19_998, 1], [7_000] * 2 + [6_000], [997] * 20 + [60]])
+def test_chunked_updates_match_pandas(sizes):
+    df = make_frame()
+    assert_matches(accumulate(split(df, sizes)), df)
+
+
+def test_chunked_updates_are_accurate():
+    df = make_frame()
+    pd.testing.assert_frame_equal(accumulate(split(df, [997] * 20 + [60])).corr(), exact_corr(df), rtol=0, atol=1e-12)
+
+
+def test_merge_order_does_not_matter():
+    df = make_frame()
+    partials = [accumulate([chunk]) for chunk in split(df, [3_000, 1, 5_000, 11_999])]
+
+    forward = CorrelationAccumulator(COLUMNS)
+    for partial in partials:
+        forward.merge(partial)
+    backward = CorrelationAccumulator(COLUMNS)
+    for partial in reversed(partials):
+        backward.merge(partial)
+    tree = accumulate(split(df, [3_000, 1])).merge(accumulate(split(df.iloc[3_001:], [5_000, 11_999])))
+
+    for merged in (forward, backward, tree):
+        assert_matches(merged, df)
+    pd.testing.assert_frame_equal(forward.corr(), backward.corr(), rtol=1e-12)
+
+
+def test_pairs_without_data_are_nan():
+    df = make_frame(rows=100)
+    df['a'] = np.nan
+    df.loc[:49, 'b'] = np.nan
+    df.loc[50:, 'c'] = np.nan
+    # The first chunk has no values at all for 'a' and 'b'.
+    assert_matches(accumulate(split(df, [50, 50])), df)
+
+
+def test_streamed_heatmap_sources_match_pandas(tmp_path, monkeypatch):
+    df = make_frame()
+    monkeypatch.setattr(DataLoader, 'TABLE_ROW_GROUP_ROWS', 1_500)
+    df.to_csv(tmp_path / 'frame.csv', index=False)
+    DataLoader.write_table(df, tmp_path / 'frame.arrow')
+    DataLoader.write_table(df, tmp_path / 'frame.parquet')
+    generator = GraphGenerator(tmp_path, tmp_path / 'output')
+    monkeypatch.setattr(GraphGenerator, 'STREAM_CHUNK_ROWS', 3_000)
+
+    # The CSV parser may round the last digit, so the CSV stream is compared with what pandas reads back.
+    assert_matches(generator.correlate({'file_name': 'frame.csv', 'columns': COLUMNS}), pd.read_csv(tmp_path / 'frame.csv'))
+    for file_name in ('frame.arrow', 'frame.parquet'):
+        assert_matches(generator.correlate({'file_name': file_name, 'columns': COLUMNS}), df)
+
+    with ProcessPoolExecutor(max_workers=3, initializer=_init_worker, initargs=(tmp_path, tmp_path / 'output')) as executor:
+        for file_name in ('frame.arrow', 'frame.parquet'):
+            assert_matches(generator.correlate({'file_name': file_name, 'columns': COLUMNS}, executor, workers=3), df)
@@ -0,0 +1,16 @@
+import pandas as pd
+import pytest
+
+from Modules.DataLoader import DataLoader
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_load_csv_rejects_unknown_columns(tmp_path, cached):
+    pd.DataFrame({'a': [1, 2], 'b': [3, 4]}).to_csv(tmp_path / 'frame.csv', index=False)
+    loader = DataLoader(tmp_path, cache_folder=tmp_path / 'cache' if cached else None)
+
+    # Without a cache, then on a cache miss, then on a cache hit.
+    for _ in range(2 if cached else 1):
+        with pytest.raises(ValueError):
+            loader.load_csv('frame.csv', usecols=['a', 'zz'])
+    assert list(loader.load_csv('frame.csv', usecols=['b', 'a']).columns) == ['a', 'b']
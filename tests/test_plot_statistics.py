@@ -0,0 +1,48 @@
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+from Modules.PlotStatistics import box_stats, violin_stats
+from Modules.Plotter import PlotterFactory
+
+matplotlib.use('Agg')
+
+
+def direct_density(values: np.ndarray, coords: np.ndarray) -> np.ndarray:
+    # Gaussian KDE with Scott's bandwidth, as violin_stats smooths it.
+    bandwidth = values.std(ddof=1) * len(values) ** (-1 / 5)
+    z = (coords[:, None] - values[None, :]) / bandwidth
+    return np.exp(-0.5 * z ** 2).sum(axis=1) / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+
+
+def assert_densities_match(df: pd.DataFrame):
+    for violin in violin_stats(df, 'g', 'y'):
+        values = df.loc[df['g'] == violin['label'], 'y'].to_numpy(dtype=float)
+        if len(values) < 2:
+            continue
+        expected = direct_density(values, violin['coords'])
+        assert len(violin['vals']) == len(violin['coords'])
+        np.testing.assert_allclose(violin['vals'], expected, rtol=0, atol=0.02 * expected.max())
+
+
+def test_small_groups_next_to_a_large_one():
+    # A 3-row group often has a kernel wider than the grid shared with the large group.
+    for seed in range(50):
+        rng = np.random.default_rng(seed)
+        df = pd.DataFrame({'g': ['a'] * 1_000 + ['b'] * 3, 'y': np.r_[rng.normal(size=1_000), rng.normal(size=3)]})
+        assert_densities_match(df)
+
+
+def test_kernel_wider_than_the_grid():
+    df = pd.DataFrame({'g': ['a'] * 5 + ['b'], 'y': [1, 2, 3, 4, 100, 5]})
+    assert_densities_match(df)
+
+
+@pytest.mark.parametrize('plot_type', ['box', 'violin'])
+def test_all_missing_values_draw_empty_axes(tmp_path, plot_type):
+    df = pd.DataFrame({'g': ['a', 'b'], 'y': [np.nan, np.nan]})
+    assert box_stats(df, 'g', 'y') == [] and violin_stats(df, 'g', 'y') == []
+
+    PlotterFactory.get_plotter(plot_type).plot(df, tmp_path / 'chart.png', x_col='g', y_col='y', title='empty')
+    assert (tmp_path / 'chart.png').exists()
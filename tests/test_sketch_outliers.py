@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+from Modules.DataProcessor import ChunkedDataProcessor, DataProcessor
+
+DATA_COLS = ['math', 'grade']
+
+
+def make_scores(rows: int = 60_000, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'group': rng.integers(0, 6, rows),
+        'math': rng.normal(550, 80, rows),
+        'grade': rng.gamma(4.0, 12.0, rows),
+    })
+    # Far outliers and missing values, as in the ENADE grades.
+    outliers = rng.random(rows) < 0.01
+    df.loc[outliers, 'math'] = rng.uniform(0, 2000, outliers.sum())
+    df.loc[rng.random(rows) < 0.02, 'grade'] = np.nan
+    return df
+
+
+def fence_tolerance(df: pd.DataFrame, relative_accuracy: float) -> pd.DataFrame:
+    # Each sketched quartile is within relative_accuracy of a value in the group, so a fence
+    # (2.5 * Q1 - 1.5 * Q3 or 2.5 * Q3 - 1.5 * Q1) moves by at most 4 * accuracy * max |value|.
+    return 4 * relative_accuracy * df.groupby('group')[DATA_COLS].agg(lambda values: values.abs().max())
+
+
+def exact_fences(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    quartiles = df.groupby('group')[DATA_COLS].quantile([0.25, 0.75])
+    Q1, Q3 = quartiles.xs(0.25, level=-1), quartiles.xs(0.75, level=-1)
+    IQR = Q3 - Q1
+    return Q1 - 1.5 * IQR, Q3 + 1.5 * IQR
+
+
+@pytest.mark.parametrize('relative_accuracy', [0.01, 0.001])
+def test_sketch_outlier_removal_differs_only_near_the_fences(relative_accuracy):
+    df = make_scores()
+    exact = DataProcessor(df).remove_outliers_by_group(DATA_COLS, 'group').build()
+    sketched = DataProcessor(df).remove_outliers_by_group(DATA_COLS, 'group', relative_accuracy=relative_accuracy).build()
+    chunked = ChunkedDataProcessor(lambda: (df.iloc[start:start + 7_000] for start in range(0, len(df), 7_000))) \
+        .remove_outliers_by_group(DATA_COLS, 'group', relative_accuracy=relative_accuracy).build()
+    assert chunked['math'].to_numpy() == pytest.approx(sketched['math'].to_numpy())
+
+    differing = df.loc[exact.index.symmetric_difference(sketched.index)]
+    tolerance = fence_tolerance(df, relative_accuracy).loc[differing['group']].to_numpy()
+    lower, upper = exact_fences(df)
+    values = differing[DATA_COLS].to_numpy()
+    distance = np.minimum(np.abs(values - lower.loc[differing['group']].to_numpy()),
+                          np.abs(values - upper.loc[differing['group']].to_numpy()))
+    # Every row the two methods disagree on lies within the fence error of an exact fence in some column.
+    assert ((distance <= tolerance) | np.isnan(values)).any(axis=1).all()
+    assert len(differing) <= 0.01 * len(exact)
+
+
+@pytest.mark.parametrize('relative_accuracy', [0.01, 0.001])
+def test_sketch_robust_aggregation_error_is_bounded(relative_accuracy):
+    df = make_scores(seed=1)
+    exact = DataProcessor(df).get_robust_group_aggregation('group', 'grade')
+    sketched = DataProcessor(df).get_robust_group_aggregation('group', 'grade', relative_accuracy=relative_accuracy)
+    chunked = ChunkedDataProcessor(lambda: iter([df.iloc[:25_000], df.iloc[25_000:]])) \
+        .get_robust_group_aggregation('group', 'grade', relative_accuracy=relative_accuracy)
+
+    # A mean over n kept rows moves by at most (rows that flip) * (value range) / n; the rows that
+    # can flip are those within the fence error of a fence.
+    lower, upper = exact_fences(df)
+    tolerance = fence_tolerance(df, relative_accuracy)['grade']
+    grades = df.dropna(subset=['grade'])
+    near = lambda fences: (grades['grade'] - fences['grade'].loc[grades['group']].to_numpy()).abs() \
+        <= tolerance.loc[grades['group']].to_numpy()
+    flippable = (near(lower) | near(upper)).groupby(grades['group']).sum()
+    kept = grades.groupby('group').size() - flippable
+    bound = flippable * (grades.groupby('group')['grade'].agg(np.ptp)) / kept
+
+    for result in (sketched, chunked):
+        assert result['group'].tolist() == exact['group'].tolist()
+        error = (result.set_index('group')['grade'] - exact.set_index('group')['grade']).abs()
+        assert (error <= bound).all()
+        assert (error <= relative_accuracy * grades['grade'].abs().max()).all()